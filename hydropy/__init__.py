@@ -45,8 +45,15 @@ __title__='hydropy'
 
 from .baseflow import (get_baseflow_chapman,
                        get_baseflow_boughton,
-                       get_baseflow_ihacres)
-from .storm import selectstorms, plotstorms
+                       get_baseflow_ihacres,
+                       get_baseflow_sweep,
+                       BaseflowFilter, ChapmanFilter, BoughtonFilter,
+                       IhacresFilter)
+from .storm import (selectstorms, segmentstorms, storms_per_station,
+                    plotstorms, plotstorms_batch)
 from .flowanalysis import HydroAnalysis
+from .events import EventTable
 from .reading_third_party_data import get_usgs
+from .store import read_store, write_store
+from .binary import open_binary, write_binary
 from .ipython import draw_map
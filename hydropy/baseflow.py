@@ -6,6 +6,76 @@ Hydropy package
 """
 import pandas as pd
 import numpy as np
+from scipy.signal import lfilter
+
+
+def _recursive_filter(flow, recession_coefficient, gain, alfa=0.,
+                      last_flow=None, last_baseflow=None):
+    r"""
+    Run the recursive baseflow filter as a linear IIR filter along the
+    first axis of the flow values
+
+    Parameters
+    ----------
+    flow : np.ndarray
+        River discharge values, time along the first axis
+    recession_coefficient : float
+        weight of the previous baseflow value
+    gain : float
+        weight of the (combined) discharge values
+    alfa : float
+        weight of the previous discharge value
+    last_flow, last_baseflow : None or np.ndarray
+        discharge and baseflow of the time step before the first flow
+        value, when None the filter starts from $Q_b(0) = 0$
+
+    Notes
+    ------
+    $$Q_b(i) = aQ_b(i-1) + b[Q(i)+\alpha Q(i-1)]$$
+
+    with $Q_b(0) = 0$, which is equal to filtering the forcing
+    $b[Q(i)+\alpha Q(i-1)]$ with denominator $[1, -a]$.
+    """
+    flow = np.asarray(flow, dtype=float)
+    if flow.shape[0] == 0:
+        return flow.copy()
+
+    forcing = np.empty_like(flow)
+    forcing[1:] = gain * (flow[1:] + alfa * flow[:-1])
+    if last_flow is None:
+        forcing[0] = 0.0
+        return lfilter([1.], [1., -recession_coefficient], forcing, axis=0)
+
+    forcing[0] = gain * (flow[0] + alfa * np.asarray(last_flow))
+    initial = recession_coefficient * \
+        np.asarray(last_baseflow, dtype=float).reshape((1,) + flow.shape[1:])
+    baseflow, _ = lfilter([1.], [1., -recession_coefficient], forcing,
+                          axis=0, zi=initial)
+    return baseflow
+
+
+def _filter_columns(flowserie, recession_coefficient, gain, alfa=0.):
+    """
+    Apply the recursive baseflow filter on all columns of the flowserie in
+    a single pass over the 2-D array of values
+
+    Parameters
+    ----------
+    flowserie : pd.Series or pd.DataFrame
+        River discharge flowserie(s), with the date in the index
+
+    Returns
+    -------
+    baseflow : pd.DataFrame
+        baseflow with the same index and column names as the flowserie
+    """
+    if isinstance(flowserie, pd.Series):
+        flowserie = flowserie.to_frame()
+
+    baseflow = _recursive_filter(flowserie.values, recession_coefficient,
+                                 gain, alfa)
+    return pd.DataFrame(baseflow, index=flowserie.index,
+                        columns=flowserie.columns)
 
 
 def get_baseflow_chapman(flowserie, recession_time):
@@ -13,8 +83,9 @@ def get_baseflow_chapman(flowserie, recession_time):
 
     Parameters
     ----------
-    flowserie :  pd.TimeSeries
-        River discharge flowserie
+    flowserie :  pd.Series or pd.DataFrame
+        River discharge flowserie, every column is handled as a
+        separate station
     recession_time : float [0-1]
         recession constant
 
@@ -24,16 +95,9 @@ def get_baseflow_chapman(flowserie, recession_time):
 
     """
 
-    secterm = (1.-recession_time)*flowserie/(2.-recession_time)
-
-    baseflow = np.empty(flowserie.shape[0])
-    for i, timestep in enumerate(baseflow):
-        if i == 0:
-            baseflow[i] = 0.0
-        else:
-            baseflow[i] = recession_time*baseflow[i-1]/(2.-recession_time) + \
-                            secterm.values[i]
-    baseflow = pd.DataFrame(baseflow, index=flowserie.index)
+    baseflow = _filter_columns(flowserie,
+                               recession_time/(2.-recession_time),
+                               (1.-recession_time)/(2.-recession_time))
     return baseflow
 
 
@@ -42,8 +106,9 @@ def get_baseflow_boughton(flowserie, recession_time, baseflow_index):
 
     Parameters
     ----------
-    flowserie :  pd.TimeSeries
-        River discharge flowserie
+    flowserie :  pd.Series or pd.DataFrame
+        River discharge flowserie, every column is handled as a
+        separate station
     recession_time : float [0-1]
         recession constant
     baseflow_index : float
@@ -56,16 +121,8 @@ def get_baseflow_boughton(flowserie, recession_time, baseflow_index):
 
     parC = baseflow_index
 
-    secterm = parC*flowserie/(1 + parC)
-
-    baseflow = np.empty(flowserie.shape[0])
-    for i, timestep in enumerate(baseflow):
-        if i == 0:
-            baseflow[i] = 0.0
-        else:
-            baseflow[i] = recession_time*baseflow[i-1]/(1 + parC) + \
-                            secterm.values[i]
-    return pd.DataFrame(baseflow, index=flowserie.index)
+    return _filter_columns(flowserie, recession_time/(1 + parC),
+                           parC/(1 + parC))
 
 
 def get_baseflow_ihacres(flowserie, recession_time, baseflow_index, alfa):
@@ -73,8 +130,9 @@ def get_baseflow_ihacres(flowserie, recession_time, baseflow_index, alfa):
 
     Parameters
     ----------
-    flowserie :  pd.TimeSeries
-        River discharge flowserie
+    flowserie :  pd.Series or pd.DataFrame
+        River discharge flowserie, every column is handled as a
+        separate station
     recession_time : float [0-1]
         recession constant
 
@@ -87,14 +145,328 @@ def get_baseflow_ihacres(flowserie, recession_time, baseflow_index, alfa):
 
     parC = baseflow_index
 
-    secterm = parC/(1 + parC)
+    return _filter_columns(flowserie, recession_time/(1 + parC),
+                           parC/(1 + parC), alfa)
+
+
+def _scan_blocks(flow, recession_coefficient, gain, alfa, chunksize):
+    """
+    Run the recursive baseflow filter for a set of parameter combinations
+    at once, block by block along the time axis
+
+    Parameters
+    ----------
+    flow : np.ndarray
+        River discharge values with shape (time, stations)
+    recession_coefficient, gain, alfa : np.ndarray
+        filter coefficients, one value for each parameter combination
+    chunksize : int
+        number of time steps handled in a single block
+
+    Returns
+    -------
+    generator of (start, stop, baseflow) with baseflow an array of shape
+    (combinations, stop - start, stations)
+
+    Notes
+    ------
+    Within a block, the recursion is solved as a prefix scan over the
+    time axis (log2(chunksize) broadcasted steps of
+    $y(i) += a^d y(i-d)$ for $d = 1, 2, 4, ...$), the last baseflow value
+    of the previous block is carried over as $a^{m+1}Q_b(start-1)$.
+    """
+    ncomb = recession_coefficient.size
+    coefficient = recession_coefficient.reshape(ncomb, 1, 1)
+    gain = gain.reshape(ncomb, 1, 1)
+    alfa = alfa.reshape(ncomb, 1, 1)
+
+    previous = np.zeros((ncomb, 1, flow.shape[1]))
+    for start in range(0, flow.shape[0], chunksize):
+        stop = min(start + chunksize, flow.shape[0])
+        block = flow[start:stop]
+        if start == 0:
+            lagged = np.vstack([block[:1], block[:-1]])
+        else:
+            lagged = flow[start - 1:stop - 1]
+
+        baseflow = gain * (block + alfa * lagged)
+        if start == 0:
+            baseflow[:, 0] = 0.0
+
+        shift = 1
+        while shift < stop - start:
+            baseflow[:, shift:] = baseflow[:, shift:] + \
+                coefficient**shift * baseflow[:, :-shift]
+            shift *= 2
+
+        steps = np.arange(1, stop - start + 1).reshape(1, -1, 1)
+        baseflow += coefficient**steps * previous
+        previous = baseflow[:, -1:]
+        yield start, stop, baseflow
+
+
+def get_baseflow_sweep(flowserie, method, recession_time,
+                       baseflow_index=None, alfa=None, summary="bfi",
+                       chunksize=10000):
+    """
+    Evaluate a baseflow filter for all combinations of the given parameter
+    values in one broadcasted computation (parameters x time)
+
+    Parameters
+    ----------
+    flowserie :  pd.Series or pd.DataFrame
+        River discharge flowserie, every column is handled as a
+        separate station
+    method : chapman | boughton | ihacres
+        The baseflow filter to use
+    recession_time : float or array of float [0-1]
+        recession constant(s)
+    baseflow_index : float or array of float
+        baseflow index value(s), used by boughton and ihacres
+    alfa : float or array of float
+        alfa value(s), used by ihacres
+    summary : 'bfi' | None
+        'bfi' returns the baseflow index (sum of baseflow / sum of flow)
+        of each combination, None returns the full baseflow series
+    chunksize : int
+        number of time steps handled at once, memory use is in the order
+        of combinations x chunksize x stations values
+
+    Returns
+    -------
+    baseflow : pd.DataFrame or np.ndarray
+        summary 'bfi': DataFrame with a row for each parameter combination
+        (MultiIndex of the parameter values) and a column for each station.
+        summary None: array of shape (combinations, time, stations), with
+        the combinations in the same order as the rows of the 'bfi' output
+
+    Examples
+    ---------
+    >>> get_baseflow_sweep(flowdata, "boughton",
+    ...                    recession_time=np.linspace(0.9, 0.99, 10),
+    ...                    baseflow_index=np.linspace(0.01, 0.5, 50))
+    """
+    if isinstance(flowserie, pd.Series):
+        flowserie = flowserie.to_frame()
+
+    if method == "chapman":
+        parameters = {"recession_time": recession_time}
+    elif method == "boughton":
+        parameters = {"recession_time": recession_time,
+                      "baseflow_index": baseflow_index}
+    elif method == "ihacres":
+        parameters = {"recession_time": recession_time,
+                      "baseflow_index": baseflow_index,
+                      "alfa": alfa}
+    else:
+        raise Exception("Choose between " +
+                        ", ".join(sorted(BASEFLOW_METHODS)) +
+                        " baseflow methods.")
+    names = [name for name in ["recession_time", "baseflow_index", "alfa"]
+             if name in parameters]
+    for name in names:
+        if parameters[name] is None:
+            raise Exception(name + " is required for the " + method +
+                            " method.")
+
+    combinations = pd.MultiIndex.from_product(
+        [np.atleast_1d(parameters[name]).astype(float) for name in names],
+        names=names)
+    values = dict((name, combinations.get_level_values(name).values)
+                  for name in names)
+
+    if method == "chapman":
+        recession_coefficient = values["recession_time"] / \
+            (2. - values["recession_time"])
+        gain = (1. - values["recession_time"]) / \
+            (2. - values["recession_time"])
+    else:
+        recession_coefficient = values["recession_time"] / \
+            (1 + values["baseflow_index"])
+        gain = values["baseflow_index"] / (1 + values["baseflow_index"])
+    alfas = values.get("alfa", np.zeros(len(combinations)))
 
-    baseflow = np.empty(flowserie.shape[0])
-    for i, timestep in enumerate(baseflow):
-        if i == 0:
-            baseflow[i] = 0.0
+    flow = np.asarray(flowserie.values, dtype=float)
+    if summary is None:
+        baseflow = np.empty((len(combinations),) + flow.shape)
+    elif summary == "bfi":
+        baseflow_sum = np.zeros((len(combinations), flow.shape[1]))
+        flow_sum = np.zeros((len(combinations), flow.shape[1]))
+    else:
+        raise Exception("Choose between 'bfi' or None as summary.")
+
+    for start, stop, block in _scan_blocks(flow, recession_coefficient,
+                                           gain, alfas, chunksize):
+        if summary is None:
+            baseflow[:, start:stop] = block
         else:
-            baseflow[i] = recession_time * baseflow[i-1]/(1 + parC) + \
-                            secterm * (flowserie.values[i] +
-                                       alfa * flowserie.values[i-1])
-    return pd.DataFrame(baseflow, index=flowserie.index)
+            valid = ~np.isnan(block)
+            baseflow_sum += np.where(valid, block, 0.).sum(axis=1)
+            flow_sum += np.where(valid, flow[start:stop], 0.).sum(axis=1)
+
+    if summary is None:
+        return baseflow
+    return pd.DataFrame(baseflow_sum / flow_sum, index=combinations,
+                        columns=flowserie.columns)
+
+
+class BaseflowFilter(object):
+    """
+    Stateful recursive baseflow filter for continuously incoming flow
+    data: only the newly appended values are filtered, starting from the
+    last baseflow and flow value of the previous update.
+
+    Use one of the method specific subclasses ChapmanFilter,
+    BoughtonFilter or IhacresFilter.
+
+    Attributes
+    -----------
+    parameters : dict
+        the filter parameters
+    last_baseflow, last_flow : pd.Series
+        baseflow and flow of the last processed time step for each station
+    last_date : pd.Timestamp
+        last processed time step
+
+    Examples
+    ---------
+    >>> bffilter = BoughtonFilter(recession_time=0.95, baseflow_index=0.1)
+    >>> baseflow = bffilter.update(flowdata["2009"])
+    >>> state = bffilter.get_state()  # e.g. json.dump(state, checkpoint)
+    >>> bffilter = BaseflowFilter.from_state(state)
+    >>> newbaseflow = bffilter.update(flowdata["2010"])
+    """
+    method = None
+
+    def __init__(self, recession_coefficient, gain, alfa=0.):
+        self._recession_coefficient = recession_coefficient
+        self._gain = gain
+        self._alfa = alfa
+        self.last_baseflow = None
+        self.last_flow = None
+        self.last_date = None
+
+    def update(self, flowserie):
+        """
+        Filter the new flow values, values not later than the last
+        processed time step are ignored
+
+        Parameters
+        ----------
+        flowserie :  pd.Series or pd.DataFrame
+            New river discharge values, every column is handled as a
+            separate station
+
+        Returns
+        -------
+        baseflow : pd.DataFrame
+            baseflow of the new time steps
+        """
+        if isinstance(flowserie, pd.Series):
+            flowserie = flowserie.to_frame()
+        if self.last_date is not None:
+            flowserie = flowserie[flowserie.index > self.last_date]
+            flowserie = flowserie[self.last_flow.index]
+        if flowserie.shape[0] == 0:
+            return pd.DataFrame(columns=flowserie.columns,
+                                index=flowserie.index, dtype=float)
+
+        if self.last_date is None:
+            values = _recursive_filter(flowserie.values,
+                                       self._recession_coefficient,
+                                       self._gain, self._alfa)
+        else:
+            values = _recursive_filter(flowserie.values,
+                                       self._recession_coefficient,
+                                       self._gain, self._alfa,
+                                       self.last_flow.values,
+                                       self.last_baseflow.values)
+        baseflow = pd.DataFrame(values, index=flowserie.index,
+                                columns=flowserie.columns)
+
+        self.last_baseflow = baseflow.iloc[-1]
+        self.last_flow = flowserie.iloc[-1].astype(float)
+        self.last_date = flowserie.index[-1]
+        return baseflow
+
+    def get_state(self):
+        """
+        Checkpoint of the filter as a dict of plain python types (json
+        serializable), to restore with BaseflowFilter.from_state
+        """
+        state = {"method": self.method, "parameters": self.parameters,
+                 "columns": None, "last_baseflow": None, "last_flow": None,
+                 "last_date": None}
+        if self.last_date is not None:
+            state["columns"] = self.last_flow.index.tolist()
+            state["last_baseflow"] = self.last_baseflow.tolist()
+            state["last_flow"] = self.last_flow.tolist()
+            state["last_date"] = self.last_date.isoformat()
+        return state
+
+    @staticmethod
+    def from_state(state):
+        """
+        Restore a filter from a checkpoint created with get_state
+        """
+        bffilter = _FILTER_CLASSES[state["method"]](**state["parameters"])
+        if state["last_date"] is not None:
+            bffilter.last_baseflow = pd.Series(state["last_baseflow"],
+                                               index=state["columns"],
+                                               dtype=float)
+            bffilter.last_flow = pd.Series(state["last_flow"],
+                                           index=state["columns"],
+                                           dtype=float)
+            bffilter.last_date = pd.Timestamp(state["last_date"])
+        return bffilter
+
+
+class ChapmanFilter(BaseflowFilter):
+    """
+    Stateful version of get_baseflow_chapman, see BaseflowFilter
+    """
+    method = "chapman"
+
+    def __init__(self, recession_time):
+        self.parameters = {"recession_time": recession_time}
+        super(ChapmanFilter, self).__init__(
+            recession_time/(2.-recession_time),
+            (1.-recession_time)/(2.-recession_time))
+
+
+class BoughtonFilter(BaseflowFilter):
+    """
+    Stateful version of get_baseflow_boughton, see BaseflowFilter
+    """
+    method = "boughton"
+
+    def __init__(self, recession_time, baseflow_index):
+        self.parameters = {"recession_time": recession_time,
+                           "baseflow_index": baseflow_index}
+        super(BoughtonFilter, self).__init__(
+            recession_time/(1 + baseflow_index),
+            baseflow_index/(1 + baseflow_index))
+
+
+class IhacresFilter(BaseflowFilter):
+    """
+    Stateful version of get_baseflow_ihacres, see BaseflowFilter
+    """
+    method = "ihacres"
+
+    def __init__(self, recession_time, baseflow_index, alfa):
+        self.parameters = {"recession_time": recession_time,
+                           "baseflow_index": baseflow_index,
+                           "alfa": alfa}
+        super(IhacresFilter, self).__init__(
+            recession_time/(1 + baseflow_index),
+            baseflow_index/(1 + baseflow_index), alfa)
+
+
+_FILTER_CLASSES = {"chapman": ChapmanFilter,
+                   "boughton": BoughtonFilter,
+                   "ihacres": IhacresFilter}
+
+BASEFLOW_METHODS = {"chapman": get_baseflow_chapman,
+                    "boughton": get_baseflow_boughton,
+                    "ihacres": get_baseflow_ihacres}
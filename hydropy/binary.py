@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Native binary format for regular hydropy time series
+
+The file contains a fixed size header, the column names and a column-major
+block of values, so every station is a contiguous array in the file::
+
+    magic       8 bytes     b'HYDROPY1'
+    start       int64       first time stamp, ns since 1970-01-01
+    step        int64       time step in ns
+    length      int64       number of time steps
+    ncols       int64       number of columns (stations)
+    dtype       8 bytes     numpy dtype string of the values, e.g. '<f4'
+    namelength  int64       length of the json encoded column names
+    names       namelength  json encoded list of the column names
+    (padding up to a multiple of 64 bytes)
+    values      ncols x length values
+
+The values are opened with numpy.memmap, so nothing is read until used and
+all processes opening the same file share the OS page cache.
+"""
+from __future__ import absolute_import, print_function
+
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+
+
+_MAGIC = b'HYDROPY1'
+_HEADER = struct.Struct('<8sqqqq8sq')
+_ALIGN = 64
+
+
+def write_binary(data, filename, dtype=None):
+    """
+    Write a regular time series to the hydropy binary format
+
+    Parameters
+    ----------
+    data : pd.DataFrame or pd.Series
+        time series with a DatetimeIndex with a fixed time step and the
+        station names as columns
+    filename : str
+        name of the file to write
+    dtype : None, 'float32' or 'float64'
+        data type of the values in the file, by default float64
+    """
+    if isinstance(data, pd.Series):
+        data = data.to_frame()
+    dtype = np.dtype(np.float64 if dtype is None else dtype)
+    if dtype.kind != 'f':
+        raise Exception("Only float32 and float64 values are supported")
+
+    stamps = data.index.values.astype('datetime64[ns]').view(np.int64)
+    if len(stamps) < 2:
+        raise Exception("At least two time steps are required")
+    steps = np.diff(stamps)
+    if steps[0] <= 0 or (steps != steps[0]).any():
+        raise Exception("The time series should have a fixed time step")
+
+    names = json.dumps([str(name) for name in data.columns]).encode('utf-8')
+    header = _HEADER.pack(_MAGIC, stamps[0], steps[0], len(stamps),
+                          data.shape[1],
+                          dtype.newbyteorder('<').str.encode('ascii'),
+                          len(names))
+    padding = -(len(header) + len(names)) % _ALIGN
+    with open(filename, 'wb') as binf:
+        binf.write(header + names + b'\0'*padding)
+        for column in data.columns:
+            np.asarray(data[column].values,
+                       dtype=dtype.newbyteorder('<')).tofile(binf)
+
+
+def read_binary_header(filename):
+    """
+    Read the header of a hydropy binary file
+
+    Returns
+    -------
+    header : dict
+        start, step, length, columns, dtype and offset (of the values)
+    """
+    with open(filename, 'rb') as binf:
+        fixed = binf.read(_HEADER.size)
+        if len(fixed) < _HEADER.size or fixed[:8] != _MAGIC:
+            raise Exception("{} is not a hydropy binary file".format(filename))
+        _, start, step, length, ncols, dtype, namelength = \
+            _HEADER.unpack(fixed)
+        columns = json.loads(binf.read(namelength).decode('utf-8'))
+    size = _HEADER.size + namelength
+    return {'start': start, 'step': step, 'length': length,
+            'columns': columns, 'dtype': dtype.rstrip(b'\0').decode('ascii'),
+            'offset': size + (-size % _ALIGN)}
+
+
+def open_binary(filename, mode='r'):
+    """
+    Open a hydropy binary file as a pd.DataFrame backed by a memory map,
+    without reading the values
+
+    Parameters
+    ----------
+    filename : str
+        name of the file to open
+    mode : 'r', 'c' or 'r+'
+        numpy.memmap mode, read-only by default; use 'c' to allow changes
+        in memory only and 'r+' to write the changes to the file
+
+    Returns
+    -------
+    data : pd.DataFrame
+        time series with a column per station
+    """
+    header = read_binary_header(filename)
+    values = np.memmap(filename, dtype=np.dtype(header['dtype']), mode=mode,
+                       offset=header['offset'],
+                       shape=(len(header['columns']), header['length']))
+    index = pd.date_range(pd.Timestamp(header['start'], unit='ns'),
+                          periods=header['length'],
+                          freq=pd.Timedelta(header['step'], unit='ns'),
+                          name='Time')
+    # the transpose of the column-major block is used as is, no copy
+    return pd.DataFrame(values.T, index=index, columns=header['columns'],
+                        copy=False)
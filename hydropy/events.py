@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Hydropy package
+
+Compact storage of selected values (peaks, values above a percentile,...)
+of a time serie.
+
+@author: Stijn Van Hoey
+"""
+from __future__ import absolute_import, print_function
+
+import numpy as np
+import pandas as pd
+
+
+class EventTable(object):
+    '''
+    Long format table of the selected values of a time serie, as a compact
+    alternative for the full time serie with NaN values in between the
+    selected values.
+
+    Attributes
+    -----------
+    table : pd.DataFrame
+        columns datetime, station and value, sorted on time and station.
+        The station column contains int32 codes, referring to the position
+        of the station name in stations
+    stations : pd.Index
+        names of the stations
+    index : pd.DatetimeIndex
+        index of the full time serie, used to expand the table again
+    '''
+
+    def __init__(self, table, stations, index):
+        self.table = table
+        self.stations = pd.Index(stations)
+        self.index = index
+
+    @classmethod
+    def from_positions(cls, index, stations, rows, columns, values):
+        """
+        Create the table from the row and column positions of the selected
+        values in the full time serie
+
+        Parameters
+        -----------
+        index : pd.DatetimeIndex
+            index of the full time serie
+        stations : list of str
+            column names of the full time serie
+        rows, columns : np.ndarray
+            positions of the selected values, sorted by row and column
+        values : np.ndarray
+            the selected values
+        """
+        table = pd.DataFrame({"datetime": index[rows],
+                              "station": np.asarray(columns, dtype=np.int32),
+                              "value": values},
+                             columns=["datetime", "station", "value"])
+        return cls(table, stations, index)
+
+    def __len__(self):
+        return self.table.shape[0]
+
+    def __repr__(self):
+        return str(len(self)) + ' events for stations ' + \
+            ', '.join(str(name) for name in self.stations) + '\n' + \
+            self.to_frame().__repr__()
+
+    def to_frame(self):
+        """
+        Return the table with the station names instead of the codes
+        """
+        table = self.table.copy()
+        table["station"] = self.stations[table["station"].values]
+        return table
+
+    def to_dense(self):
+        """
+        Expand the table to the full time serie, with NaN values in
+        between the selected values
+
+        Returns
+        --------
+        pd.DataFrame with the index of the original time serie and a column
+        for each station
+        """
+        dense = np.full((len(self.index), len(self.stations)), np.nan)
+        rows = self.index.searchsorted(self.table["datetime"].values)
+        dense[rows, self.table["station"].values] = \
+            self.table["value"].values
+        return pd.DataFrame(dense, index=self.index, columns=self.stations)
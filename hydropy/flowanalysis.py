@@ -10,12 +10,45 @@ import datetime
 import calendar
 
 import numpy as np
-from scipy.signal import argrelmax, argrelmin
 import pandas as pd
-from pandas.tseries.offsets import DateOffset
+from pandas.tseries.offsets import DateOffset, Tick, Day
 
-from .storm import selectstorms, plotstorms
+from .baseflow import BASEFLOW_METHODS
+from .events import EventTable
+from .storm import selectstorms, plotstorms, storms_per_station
 from .reading_third_party_data import load_VMM_zrx_timeserie
+from .store import read_store, write_store
+from .binary import open_binary, write_binary
+
+
+def _regular_index(index):
+    """
+    Describe a regular (fixed time step, timezone naive) DatetimeIndex by
+    the int64 nanoseconds of its first time stamp and time step and its
+    length, returns None for other indices
+    """
+    freq = index.freq
+    if len(index) == 0 or index.tz is not None or \
+            not isinstance(freq, (Tick, Day)):
+        return None
+    return index[0].value, freq.nanos, len(index)
+
+
+def _period_bounds(start, end):
+    """
+    First and last time stamp of a date selection, following the pandas
+    label slicing: a str includes the whole period it describes, e.g. the
+    end '2010' includes all of 2010
+    """
+    if isinstance(start, str):
+        start = pd.Period(start).start_time
+    elif start is not None:
+        start = pd.Timestamp(start)
+    if isinstance(end, str):
+        end = pd.Period(end).end_time
+    elif end is not None:
+        end = pd.Timestamp(end)
+    return start, end
 
 
 class HydroAnalysis(object):
@@ -35,10 +68,23 @@ class HydroAnalysis(object):
         series
     _season_type : astro or meteo
         The used definition of seasons, meteorological or astrological
+
+    Notes
+    ------
+    The selection methods (__getitem__, get_date_range, get_season,...)
+    return views: the new object shares the data buffers (as far as
+    pandas allows) and the metadata of the object it is derived from,
+    without deriving the frequency and seasons again. Use copy() to get
+    an independent object.
+
+    The sorted values used by quantile (and the percentile selections)
+    are kept on the object until data is replaced. After editing data in
+    place, call invalidate_quantiles().
     '''
 
     def __init__(self, data, dateformatstr="%d/%m/%Y", hemisphere="north",
-                 season_type="meteo", datacols=None):
+                 season_type="meteo", datacols=None, copy=True,
+                 compact=False):
         """
         Time serie handling for the package centralized.
 
@@ -54,9 +100,15 @@ class HydroAnalysis(object):
             seasons started on meteorological of astrological time stamps
         datacols : None | list of str
             when None, all columns are interpreted as data column
+        copy : bool
+            when False, the data values of a pd.DataFrame are not copied
+        compact : bool
+            when True, the float data is stored as float32 and the season
+            labels are not added as a column to the data, but derived when
+            needed (see _season_labels), to halve the memory use
         """
         if isinstance(data, pd.DataFrame):
-            self.data = data.copy()
+            self.data = data.copy(deep=copy)
         else:
             try:
                 # What if the data doesn't have a copy() method?
@@ -88,6 +140,7 @@ class HydroAnalysis(object):
                 # print("Frequency of the Time Serie is guessed as", \
                 #        self.data.index.freq)
             else:
+                self._frequency = None
                 print("Not able to interpret the time serie frequency,\
                       run the frequency_change to define the frequency!")
 
@@ -101,18 +154,88 @@ class HydroAnalysis(object):
         else:
             self._data_cols = self.data.columns
 
-        # Save start and enddate of the timeserie
+        self._set_date_range()
+        self._regular = _regular_index(self.data.index)
+
+        self._hemisphere = hemisphere
+        self._season_type = season_type
+        self._compact = compact
+        if compact:
+            self.data = self.data.astype(dict(
+                (name, np.float32) for name in self._data_cols
+                if self.data[name].dtype.kind == 'f'))
+
+        # Create selection masks
+        self._mask_seasons()
+
+    @property
+    def data(self):
+        """time serie information, see the class documentation"""
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self.invalidate_quantiles()
+
+    def _set_date_range(self):
+        """Save start and enddate and the years of the timeserie
+        """
         self._start_date = self.data.index[0]
         self._end_date = self.data.index[-1]
 
         # get all years of the timeserie
         self._years = range(self._start_date.year, self._end_date.year + 1)
 
-        self._hemisphere = hemisphere
-        self._season_type = season_type
+    def _view(self, data, datacols=None):
+        """
+        Wrap a selection of the data in a new object, sharing the metadata
+        (frequency, season labels, data columns) with the current object
+        instead of copying the data and deriving the metadata again
 
-        # Create selection masks
-        self._mask_seasons()
+        Parameters
+        -----------
+        data : pd.DataFrame
+            selection of self.data, including the season column
+        datacols : None | list of str
+            when None, the data columns of the current object
+        """
+        if data.shape[0] == 0:
+            raise Exception("Selection contains no data.")
+        view = self.__class__.__new__(self.__class__)
+        view.data = data
+        view._frequency = self._frequency
+        if datacols is None:
+            view._data_cols = self._data_cols
+        else:
+            view._data_cols = datacols
+        view._hemisphere = self._hemisphere
+        view._season_type = self._season_type
+        view._compact = self._compact
+        # the season labels of the parent are kept for the selected rows
+        view._season = None
+        if self._season is not None and self.data.index.is_unique:
+            view._season = self._season.reindex(data.index)
+        view._set_date_range()
+        view._regular = _regular_index(data.index)
+        return view
+
+    def copy(self):
+        """returns an independent copy of the object
+        """
+        return self._view(self.data.copy())
+
+    def lazy(self):
+        """
+        Start a lazy selection on the object: the selections are recorded
+        and evaluated in a single combined mask when the data is requested
+
+        Examples
+        ---------
+        >>> query = myflowserie.lazy().get_year('2009').get_season('summer')
+        >>> query.get_above_percentile(0.9).collect().plot()
+        """
+        return HydroQuery(self)
 
     def __str__(self):
         return self.data.__repr__()
@@ -134,14 +257,23 @@ class HydroAnalysis(object):
         eg hydroobject["2009":"2011"] or
         """
         if isinstance(val, str) and val in self._data_cols:
-            return self.__class__(self.data[val].copy(), datacols=[val])
+            return self._view(self.data[[val] + self._label_cols()],
+                              datacols=[val])
         elif isinstance(val, list):
             for name in val:
                 if name not in self._data_cols:
                     raise Exception("this selection not supported")
-            return self.__class__(self.data[val].copy(), datacols=val)
+            return self._view(self.data[val + self._label_cols()],
+                              datacols=val)
+        elif isinstance(val, (str, datetime.datetime)):
+            # partial string indexing of the rows, e.g. "2009"
+            return self._date_slice(val, val)
+        elif isinstance(val, slice) and val.step is None:
+            return self._date_slice(val.start, val.stop)
+        elif isinstance(val, slice):
+            return self._view(self.data.loc[val])
         else:
-            return self.__class__(self.data[val].copy(), datacols=self._data_cols)
+            return self._view(self.data[val])
 
     def __setitem__(self, val):
         """
@@ -152,7 +284,7 @@ class HydroAnalysis(object):
         """controller for date range
         """
         if isinstance(date2test, str):
-            date2test = pd.datetools.to_datetime(date2test)
+            date2test = pd.to_datetime(date2test)
         if not isinstance(date2test, datetime.datetime):
             raise Exception("Current str or datetime object \
                                                     could not be parsed.")
@@ -201,12 +333,98 @@ class HydroAnalysis(object):
         http://pandas.pydata.org/pandas-docs/dev/timeseries.html#legacy-aliases
         """
         return self.__class__(self.data.asfreq(freq, *args, **kwargs),
-                              datacols=self._data_cols)
+                              hemisphere=self._hemisphere,
+                              season_type=self._season_type,
+                              datacols=self._data_cols, copy=False,
+                              compact=self._compact)
+
+    def _positions(self, dates):
+        """
+        Row positions of the first time stamps at or after the given
+        int64 nanosecond dates of a regular time serie, computed from the
+        start and time step instead of searching the index
+        """
+        start, step, length = self._regular
+        positions = -((start - np.asarray(dates, dtype=np.int64)) // step)
+        return np.clip(positions, 0, length)
 
-    def _pass_freq(self, df):
-        """help function to pass frequency to next item
+    def _date_slice(self, start, end):
+        """
+        Select the rows from start till end (pandas label slicing), for a
+        regular time serie the integer bounds are derived arithmetically
+        """
+        if self._regular is None:
+            return self._view(self.data.loc[start:end])
+        try:
+            start, end = _period_bounds(start, end)
+        except ValueError:
+            # not parsable as a period, let pandas handle it
+            return self._view(self.data.loc[start:end])
+        first = 0 if start is None else self._positions(start.value)
+        last = self._regular[2] if end is None else \
+            self._positions(end.value + 1)
+        return self._view(self.data.iloc[first:last])
+
+    def _year_starts(self, month=1, day=1, years=None):
+        """int64 nanoseconds of the given month and day in each year"""
+        if years is None:
+            years = np.arange(self._start_date.year,
+                              self._end_date.year + 1)
+        dates = (years - 1970).astype('datetime64[Y]').astype(
+            'datetime64[M]') + (month - 1)
+        dates = dates.astype('datetime64[D]') + (day - 1)
+        return dates.astype('datetime64[ns]').view(np.int64)
+
+    def _select_ranges(self, starts, stops):
+        """
+        Select the rows in the ranges [starts, stops) of row positions, see
+        _select_rows
+        """
+        nonempty = stops > starts
+        if not nonempty.any():
+            raise Exception("Selection contains no data.")
+        starts, stops = starts[nonempty], stops[nonempty]
+        first, last = starts[0], stops[-1]
+        # +1 at the start and -1 at the stop of each range
+        marks = np.zeros(last - first + 1, dtype=np.int64)
+        np.add.at(marks, starts - first, 1)
+        np.add.at(marks, stops - first, -1)
+        return self._select_between(first, last, np.cumsum(marks[:-1]) > 0)
+
+    def _select_rows(self, rows):
+        """
+        Select the rows marked in the boolean array rows, from the first
+        till the last selected row. The rows in between which are not
+        selected are set to NaN, keeping the frequency of the time serie.
         """
-        return df.asfreq(self.data.index.freq)
+        positions = np.flatnonzero(rows)
+        if positions.size == 0:
+            raise Exception("Selection contains no data.")
+        first, last = positions[0], positions[-1] + 1
+        return self._select_between(first, last,
+                                    np.asarray(rows[first:last]))
+
+    def _select_between(self, first, last, rows):
+        """
+        Select the rows first till last, with the rows not marked in the
+        boolean array rows (of length last - first) set to NaN
+        """
+        if rows.all():
+            return self._view(self.data.iloc[first:last])
+        keep = np.repeat(rows.reshape(-1, 1), self.data.shape[1], axis=1)
+        for name in self._label_cols():
+            keep[:, self.data.columns.get_loc(name)] = True
+        return self._view(self.data.iloc[first:last].where(keep))
+
+    def _select_values(self, selection):
+        """
+        Select the data values marked in the boolean DataFrame selection
+        (with the data columns), other values are set to NaN
+        """
+        keep = selection.reindex(columns=self.data.columns, fill_value=False)
+        for name in self._label_cols():
+            keep[name] = True
+        return self._view(self.data.where(keep))
 
     def frequency_resample(self, *args, **kwargs):
         """
@@ -217,7 +435,8 @@ class HydroAnalysis(object):
         >>>  temp.frequency_resample('D', "mean") # Daily means
         """
         return self.__class__(self.data.resample(*args, **kwargs),
-                              datacols=self._data_cols)
+                              datacols=self._data_cols,
+                              compact=self._compact)
 
     def summary(self):
         """returns summary/description of the data
@@ -241,13 +460,148 @@ class HydroAnalysis(object):
 
     def quantile(self, q, axis=0):
         """pipe the pandas quantile function
+
+        The quantiles of the data columns (axis=0) are interpolated in the
+        sorted values of the columns, which are sorted only once and kept
+        on the object, so repeated quantiles (e.g. percentile selections
+        and peaks) do not sort the data again. The result equals the
+        pandas (linear interpolation) quantile.
+
+        The sorted values are dropped when data is replaced, but not when
+        data is edited in place: call invalidate_quantiles() after such
+        edits.
+        """
+        if axis not in (0, "index"):
+            return self.data[self._data_cols].quantile(q, axis)
+
+        quantiles = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        if ((quantiles < 0.) | (quantiles > 1.)).any():
+            raise ValueError("percentiles should all be in the interval "
+                             "[0, 1]")
+        columns = []
+        for name in self._data_cols:
+            values = self._sorted_values(name)
+            result = self._interpolate_sorted(values, quantiles)
+            if values.dtype.kind == 'f':
+                # float32 (compact) columns keep their dtype
+                result = result.astype(values.dtype)
+            columns.append(result)
+        if np.ndim(q) == 0:
+            return pd.Series([column[0] for column in columns],
+                             index=self._data_cols, name=q)
+        result = pd.DataFrame(dict(enumerate(columns)),
+                              index=pd.Index(quantiles))
+        result.columns = self._data_cols
+        return result
+
+    def invalidate_quantiles(self):
+        """
+        Drop the sorted values kept for quantile, needed after editing
+        the values of data in place, e.g. myflowserie.data['Q1'] *= 2
+        """
+        self._sorted = {}
+
+    def _sorted_values(self, name):
+        """
+        Sorted non-NaN values of the data column name, sorted once and
+        kept until invalidate_quantiles
         """
-        return self.data.quantile(q, axis)
+        values = self._sorted.get(name)
+        if values is None:
+            values = self.data[name].to_numpy()
+            if values.dtype.kind == 'f':
+                values = values[~np.isnan(values)]
+            values = np.sort(values)
+            self._sorted[name] = values
+        return values
+
+    @staticmethod
+    def _interpolate_sorted(values, quantiles):
+        """
+        Linear interpolation of the quantiles in the sorted values, with
+        the same (numpy) formula as pandas: a + (b - a)*t, or
+        b - (b - a)*(1 - t) when t >= 0.5
+        """
+        if len(values) == 0:
+            return np.full(len(quantiles), np.nan)
+        position = quantiles*(len(values) - 1)
+        below = np.floor(position).astype(np.int64)
+        above = np.minimum(below + 1, len(values) - 1)
+        weight = position - below
+        first = values[below].astype(np.float64)
+        difference = values[above] - first
+        return np.where(weight >= 0.5,
+                        values[above] - difference*(1 - weight),
+                        first + difference*weight)
 
     def plot(self, *args, **kwargs):
         """quick pandas supported plot function
+
+        Parameters
+        ----------
+        decimate : bool or int
+            When True or an integer, the data is decimated before plotting
+            by only keeping the minimum and the maximum of every column
+            within each pixel column of the plot, so the peaks are never
+            lost while the number of points drawn depends on the plot
+            width instead of the record length. An integer gives the
+            number of pixel columns, True derives them from the figsize
+            (or ax) and the dpi.
+        *args, **kwargs :
+            passed to pd.DataFrame.plot
+        """
+        decimate = kwargs.pop("decimate", False)
+        if decimate is False:
+            return self.data.plot(*args, **kwargs)
+
+        if decimate is True:
+            decimate = self._plot_width(kwargs.get("ax"),
+                                        kwargs.get("figsize"))
+        rows = self._decimate_rows(
+            self.data[self._data_cols].to_numpy(dtype=float), int(decimate))
+        return self.data.iloc[rows].plot(*args, **kwargs)
+
+    @staticmethod
+    def _plot_width(ax=None, figsize=None):
+        """width in pixels of the axis or else of the figure to draw on"""
+        import matplotlib as mpl
+        if ax is not None:
+            return max(int(ax.get_window_extent().width), 1)
+        if figsize is None:
+            figsize = mpl.rcParams["figure.figsize"]
+        return max(int(figsize[0]*mpl.rcParams["figure.dpi"]), 1)
+
+    @staticmethod
+    def _decimate_rows(values, buckets):
+        """
+        Get the row positions of the minimum and maximum of every column
+        within each of the buckets (pixel columns), together with the first
+        and last row
+
+        Parameters
+        ----------
+        values : 2-D ndarray
+            rows as time steps, columns as stations
+        buckets : int
+            number of (equal sized) buckets to split the rows in
         """
-        return self.data.plot(*args, **kwargs)
+        nrows = values.shape[0]
+        if nrows <= 2*buckets + 2:
+            return np.arange(nrows)
+
+        size = -(-nrows // buckets)
+        padded = np.full((size*buckets,) + values.shape[1:], np.nan)
+        padded[:nrows] = values
+        padded = padded.reshape((buckets, size, -1))
+        isnan = np.isnan(padded)
+        # NaN never wins, unless the whole bucket is empty
+        argmin = np.where(isnan, np.inf, padded).argmin(axis=1)
+        argmax = np.where(isnan, -np.inf, padded).argmax(axis=1)
+        offset = (np.arange(buckets)*size)[:, None]
+        rows = np.concatenate([(argmin + offset).ravel(),
+                               (argmax + offset).ravel(),
+                               [0, nrows - 1]])
+        return np.unique(rows[rows < nrows])
 
     def current_date_range(self):
         """
@@ -265,6 +619,73 @@ class HydroAnalysis(object):
         vmm_serie = cls(load_VMM_zrx_timeserie(zrxfile))
         return vmm_serie
 
+    @classmethod
+    def from_store(cls, path, stations=None, start=None, end=None,
+                   **kwargs):
+        """
+        Read the stations and period of interest from a hydropy store,
+        only the files of the requested stations and years are read
+
+        Parameters
+        ----------
+        path : str
+            directory of the store
+        stations : None, str or list of str
+            names of the stations to read, by default all stations
+        start, end : None, str or datetime
+            first and last date of the period to read
+        **kwargs :
+            passed to HydroAnalysis, e.g. hemisphere or season_type
+        """
+        return cls(read_store(path, stations, start, end), copy=False,
+                   **kwargs)
+
+    def to_store(self, path, mode='append'):
+        """
+        Write the data columns to a hydropy store, a Parquet file per
+        station and year (see hydropy.store.write_store)
+
+        Parameters
+        ----------
+        path : str
+            directory of the store
+        mode : 'append' or 'overwrite'
+            update or replace the stored years of the stations
+        """
+        write_store(self.data[self._data_cols], path, mode=mode)
+
+    @classmethod
+    def from_binary(cls, filename, mode='r', **kwargs):
+        """
+        Open a hydropy binary file (see hydropy.binary) as a memory map,
+        the values are only read from the file when used, e.g. a
+        get_date_range only touches the pages of that range
+
+        Parameters
+        ----------
+        filename : str
+            name of the hydropy binary file
+        mode : 'r', 'c' or 'r+'
+            numpy.memmap mode, read-only by default
+        **kwargs :
+            passed to HydroAnalysis, e.g. hemisphere or season_type
+        """
+        return cls(open_binary(filename, mode=mode), copy=False, **kwargs)
+
+    def to_binary(self, filename, dtype=None):
+        """
+        Write the data columns to the hydropy binary format, which requires
+        a fixed time step (see hydropy.binary.write_binary)
+
+        Parameters
+        ----------
+        filename : str
+            name of the file to write
+        dtype : None, 'float32' or 'float64'
+            data type of the values in the file, by default float64
+        """
+        write_binary(self.data[self._data_cols], filename, dtype=dtype)
+
     @classmethod
     def from_txtdata_only(cls, filename, startdate,
                           enddate, freq,
@@ -361,17 +782,70 @@ class HydroAnalysis(object):
 
     def _mask_seasons(self):
         """
-        Add column to data-sets with the season information
+        Add column to data-sets with the season information, in compact
+        mode the season labels are only derived when needed
+        """
+        self._season = None
+        if not self._compact:
+            self.data["season"] = self._season_categorical()
 
-        #TODO last season switch not tackled!!
+    def _label_cols(self):
+        """names of the non-data label columns in the data"""
+        return [] if self._compact else ["season"]
+
+    def _season_labels(self):
+        """
+        The season label of every time step as a pd.Series, from the
+        season column or, in compact mode, derived once and kept apart
+        from the data
+        """
+        if not self._compact:
+            return self.data["season"]
+        if self._season is None:
+            self._season = pd.Series(self._season_categorical(),
+                                     index=self.data.index, name="season")
+        return self._season
+
+    def _season_categorical(self):
+        """
+        Every time step gets the season with the latest start date (month
+        and day) on or before it, derived in one pass from the month and
+        day of the index (or the season ranges of a regular time serie) as
+        a categorical with int8 codes
         """
-        self.data.loc[:, "season"] = None
         seasons = self.current_season_dates()
-        for year in self._years:
-            for season in seasons.keys():
-                season_start, \
-                    season_end = self.season_dates(season, str(year), seasons)
-                self.data.loc[season_start: season_end, "season"] = season
+        names = sorted(seasons, key=seasons.get)
+        if self._regular is not None:
+            starts, _, codes = self._season_ranges(seasons, names)
+            codes = np.repeat(codes, np.diff(np.r_[starts,
+                                                   self._regular[2]]))
+        else:
+            startdays = np.array([int(seasons[name]) for name in names])
+            monthdays = self.data.index.month * 100 + self.data.index.day
+            # before the first start date of the year -> last season of
+            # the year
+            codes = np.searchsorted(startdays, monthdays,
+                                    side="right") - 1
+        return pd.Categorical.from_codes(codes % len(names),
+                                         categories=names)
+
+    def _season_ranges(self, seasons, names):
+        """
+        Row ranges [starts, stops) of the consecutive seasons of a regular
+        time serie and the code of their season in names, from the
+        season start dates of each year (starting the year before the
+        first time step, to cover its season)
+        """
+        years = np.arange(self._start_date.year - 1,
+                          self._end_date.year + 1)
+        starts = np.concatenate([
+            self._year_starts(int(seasons[name][:2]),
+                              int(seasons[name][2:]), years)[:, None]
+            for name in names], axis=1).ravel()
+        starts = self._positions(starts)
+        stops = np.r_[starts[1:], self._regular[2]]
+        codes = np.tile(np.arange(len(names)), len(years))
+        return starts, stops, codes
 
     def get_date_range(self, start, end):
         """
@@ -379,8 +853,7 @@ class HydroAnalysis(object):
         """
         self._check_date_range(start)
         self._check_date_range(end)
-        return self.__class__(self.data.loc[start: end, :].copy(),
-                              datacols=self._data_cols)
+        return self._date_slice(start, end)
 
     def get_year(self, year):
         """
@@ -409,9 +882,15 @@ class HydroAnalysis(object):
             The month to select (integer, abbr of full name)
         """
         month_id = self._existing_month(month)
-        df = self.data.groupby(lambda x: x.month).get_group(month_id)
-        df = self._pass_freq(df)
-        return self.__class__(df, datacols=self._data_cols)
+        if self._regular is None:
+            return self._select_rows(self.data.index.month == month_id)
+        years = np.arange(self._start_date.year, self._end_date.year + 1)
+        starts = self._year_starts(month_id, 1, years)
+        # start of the next month, in the next year for december
+        stops = self._year_starts(month_id % 12 + 1, 1,
+                                  years + (month_id == 12))
+        return self._select_ranges(self._positions(starts),
+                                   self._positions(stops))
 
     def get_season(self, season):
         """
@@ -429,10 +908,16 @@ class HydroAnalysis(object):
         year, till march of the selected year.
         """
         season = season.capitalize()
-        # return self.__class__(self.data[self.data["season"] == season])
-        df = self.data[self.data["season"] == season].copy()
-        df = self._pass_freq(df)
-        return self.__class__(df, datacols=self._data_cols)
+        if self._regular is None:
+            return self._select_rows(
+                (self._season_labels() == season).values)
+        seasons = self.current_season_dates()
+        names = sorted(seasons, key=seasons.get)
+        if season not in names:
+            raise Exception("Selection contains no data.")
+        starts, stops, codes = self._season_ranges(seasons, names)
+        selected = codes == names.index(season)
+        return self._select_ranges(starts[selected], stops[selected])
 
     def get_climbing(self):
         """
@@ -440,9 +925,7 @@ class HydroAnalysis(object):
         time step
         """
         climbing = self.data[self._data_cols].diff() > 0.0
-        df = self.data[climbing].copy()
-        df = self._pass_freq(df)
-        return self.__class__(df, datacols=self._data_cols)
+        return self._select_values(climbing)
 
     def get_recess(self):
         """
@@ -450,11 +933,19 @@ class HydroAnalysis(object):
         time step
         """
         recess = self.data[self._data_cols].diff() < 0.0
-        df = self.data[recess].copy()
-        df = self._pass_freq(df)
-        return self.__class__(df, datacols=self._data_cols)
+        return self._select_values(recess)
 
-    def get_above_percentile(self, percentile):
+    def _values_table(self, selection):
+        """
+        EventTable of the data values marked in the boolean DataFrame
+        selection (with the data columns)
+        """
+        rows, columns = np.nonzero(selection.values)
+        values = self.data[self._data_cols].values[rows, columns]
+        return EventTable.from_positions(self.data.index, self._data_cols,
+                                         rows, columns, values)
+
+    def get_above_percentile(self, percentile, as_table=False):
         """
         Select the data with values above the given percentile
 
@@ -462,13 +953,17 @@ class HydroAnalysis(object):
         -----------
         percentile : float [0-1]
             percentile to use
+        as_table : bool
+            when True, an EventTable of the selected values is returned
+            instead of the full time serie with NaN values
         """
         percentilevalue = self.quantile(percentile)
-        df = self.data[self.data > percentilevalue].copy()
-        df = self._pass_freq(df)
-        return self.__class__(df, datacols=self._data_cols)
+        selection = self.data[self._data_cols] > percentilevalue
+        if as_table:
+            return self._values_table(selection)
+        return self._select_values(selection)
 
-    def get_below_percentile(self, percentile):
+    def get_below_percentile(self, percentile, as_table=False):
         """
         Select the data with values below the given percentile
 
@@ -476,32 +971,83 @@ class HydroAnalysis(object):
         -----------
         percentile : float [0-1]
             percentile to use
+        as_table : bool
+            when True, an EventTable of the selected values is returned
+            instead of the full time serie with NaN values
         """
         percentilevalue = self.quantile(percentile)
-        df = self.data[self.data < percentilevalue].copy()
-        df = self._pass_freq(df)
-        return self.__class__(df, datacols=self._data_cols)
+        selection = self.data[self._data_cols] < percentilevalue
+        if as_table:
+            return self._values_table(selection)
+        return self._select_values(selection)
 
 # %%
     @staticmethod
-    def _getridof_double_peaks(data):
+    def _find_peaks(values, order, comparator):
         """
-        Small hack function to eliminate double peak values from a timeserie
+        Vectorized search of the local extremes in every column of values,
+        comparing each value with the order values before and after it
+        (wrapping around at the edges, as scipy.signal.argrelextrema)
+
+        Plateaus are handled without perturbing the values: of equal values
+        within the window, only the first one is selected.
 
         Parameters
         -----------
-        data : pd.DataFrame
-        """
-        diff = data.diff()
-        data[diff == 0.] = data[diff == 0.] - 0.001
-        # data[diff == 0.] = data[diff == 0.] - 0.001
-        # tt = temp.data[temp._data_cols].where(diff!=0.0, temp.data[temp._data_cols] + 0.001)
-        return data
+        values : np.ndarray
+            data values, time along the first axis
+        order : int
+            number of values on each side to compare with
+        comparator : np.greater | np.less
+            np.greater for peaks, np.less for lows
 
-    def get_highpeaks(self, min_distance, above_percentile=0.):
+        Returns
+        --------
+        rows, columns : np.ndarray
+            positions of the extremes, sorted by row and column
         """
-        Select peak discharges from the time serie, using the
-        scipy.argrelmax algorithm.
+        positions = np.arange(values.shape[0])
+        extreme = np.ones(values.shape, dtype=bool)
+        for shift in range(1, order + 1):
+            earlier = values.take(positions - shift, axis=0, mode='wrap')
+            extreme &= comparator(values, earlier)
+            later = values.take(positions + shift, axis=0, mode='wrap')
+            extreme &= comparator(values, later) | (values == later)
+            if not extreme.any():
+                break
+        return np.nonzero(extreme)
+
+    def _get_peaks(self, min_distance, comparator, percentilevalue,
+                   as_table):
+        """
+        Select the local extremes beyond the percentile values, as a
+        HydroAnalysis object or as a table (see get_highpeaks)
+        """
+        values = self.data[self._data_cols].values
+        rows, columns = self._find_peaks(values, min_distance, comparator)
+        peakvalues = values[rows, columns]
+
+        beyond = comparator(peakvalues,
+                            np.asarray(percentilevalue)[columns])
+        rows, columns = rows[beyond], columns[beyond]
+
+        if as_table:
+            return EventTable.from_positions(self.data.index,
+                                             self._data_cols, rows, columns,
+                                             peakvalues[beyond])
+
+        selection = np.zeros(values.shape, dtype=bool)
+        selection[rows, columns] = True
+        return self._select_values(pd.DataFrame(selection,
+                                                index=self.data.index,
+                                                columns=self._data_cols))
+
+    def get_highpeaks(self, min_distance, above_percentile=0.,
+                      as_table=False):
+        """
+        Select peak discharges from the time serie: values larger than the
+        min_distance values before and after (the first one of a plateau
+        of equal values), as the scipy.argrelmax algorithm.
         This can be above a certain percentile value defined with
         above_percentile.
 
@@ -511,75 +1057,39 @@ class HydroAnalysis(object):
             distance to use for comparison of a peak
         above_percentile : float [0-1]
             only peaks above the given percentile will be selected
+        as_table : bool
+            when True, an EventTable of the peaks is returned instead of
+            the full time serie with NaN values in between the peaks
 
-        #TODO: clean output choice=> not in freq, just short list
-        # This is still 1D!
-        # or maybe use find_peaks_cwt
+        Returns
+        --------
+        HydroAnalysis object with the peak values or, when as_table, an
+        EventTable of the peaks
         """
         percentilevalue = self.quantile(above_percentile)
+        return self._get_peaks(min_distance, np.greater, percentilevalue,
+                               as_table)
 
-        # use the peaks_above_percentile function
-        peakcleaned = self._getridof_double_peaks(self.data[self._data_cols].copy())
-        selected_peaks = argrelmax(peakcleaned.values, order=min_distance,
-                                   mode='wrap', axis=0)
-
-        # Get the rows with peaks (for any station)
-        # select unique rows to keep indices at dframe level later on
-        rows, rev_ind = np.unique(selected_peaks[0], return_inverse=True)
-        # peakrows = peakcleaned.iloc[rows, :]
-        peakrows = self.data.ix[rows, self._data_cols].copy()  # original data use
-
-        # building dummy matrix for element selection of dframe
-        temp1 = np.zeros_like(peakrows.values)
-        for i, j in zip(rev_ind, selected_peaks[1]):
-                temp1[i, j] = 1.
-        high_peaks = temp1 * peakrows
-        high_peaks[high_peaks == 0] = np.nan
-
-        # Only keep the ones above percentile value
-        high_peaks = high_peaks[high_peaks > percentilevalue]
-
-        high_peaks = high_peaks.reindex(index=self.data.index)
-        return self.__class__(high_peaks, datacols=self._data_cols)
-
-    def get_lowpeaks(self, min_distance, below_percentile=1.):
+    def get_lowpeaks(self, min_distance, below_percentile=1.,
+                     as_table=False):
         """
-        Select peak discharges from the time serie, uysing the
-        scipy.argrelmin algorithm
-
-        NOT WORKING YET!
+        Select low peak discharges from the time serie: values smaller than
+        the min_distance values before and after (the first one of a
+        plateau of equal values), as the scipy.argrelmin algorithm
 
         Parameters
         -----------
         min_distance : int
             distance to use for comparison of a peak
+        below_percentile : float [0-1]
+            only peaks below the given percentile will be selected
+        as_table : bool
+            when True, an EventTable of the peaks is returned instead of
+            the full time serie with NaN values in between the peaks
         """
         percentilevalue = self.quantile(below_percentile)
-
-        # use the peaks_above_percentile function
-        peakcleaned = self._getridof_double_peaks(self.data[self._data_cols])
-        selected_peaks = argrelmin(peakcleaned.values, order=min_distance,
-                                   mode='wrap', axis=0)
-
-        # Get the rows with peaks (for any station)
-        # select unique rows to keep indices at dframe level later on
-        rows, rev_ind = np.unique(selected_peaks[0], return_inverse=True)
-        # peakrows = peakcleaned.iloc[rows, :]
-        peakrows = self.data.ix[rows, self._data_cols].copy()  # original data use
-
-        # building dummy matrix for element selection of dframe
-        temp1 = np.zeros_like(peakrows.values)
-        for i, j in zip(rev_ind, selected_peaks[1]):
-                temp1[i, j] = 1.
-        low_peaks = temp1 * peakrows
-        low_peaks[low_peaks == 0] = np.nan
-
-        # Only keep the ones below percentile value
-        low_peaks = low_peaks[low_peaks < percentilevalue]
-
-        low_peaks = low_peaks.reindex(index=self.data.index)
-        return self.__class__(low_peaks, datacols=self._data_cols)
-
+        return self._get_peaks(min_distance, np.less, percentilevalue,
+                               as_table)
 
 # %%
     def derive_storms(self, rainserie, column, number_of_storms=3,
@@ -596,6 +1106,58 @@ class HydroAnalysis(object):
                                    period_title=True)
         return storms
 
+    def derive_storms_stations(self, raindata, pairs=None, segment=False,
+                               processes=None, **kwargs):
+        """
+        Select the storms of all data columns in parallel, see
+        storm.storms_per_station
+
+        Parameters
+        -----------
+        raindata : pd.DataFrame or pd.Series
+            rain timeseries, a single Series is used for all stations
+        pairs : None or dict
+            rain column to use for each data column, by default the rain
+            column with the same name
+        segment : bool
+            use segmentstorms instead of selectstorms
+        processes : None or int
+            number of worker processes
+        """
+        return storms_per_station(self.data[self._data_cols], raindata,
+                                  pairs=pairs, segment=segment,
+                                  processes=processes, **kwargs)
+
+# %%
+    def get_baseflow(self, method="chapman", **params):
+        """
+        Derive the baseflow of all data columns at once with one of the
+        recursive baseflow filters
+
+        Parameters
+        -----------
+        method : chapman | boughton | ihacres
+            The baseflow filter to use
+        **params :
+            Parameters of the filter, e.g. recession_time, baseflow_index
+            and alfa, see the get_baseflow_* functions
+
+        Examples
+        ---------
+        >>> myflowserie.get_baseflow("boughton", recession_time=0.95,
+        ...                          baseflow_index=0.1)
+        """
+        if method not in BASEFLOW_METHODS:
+            raise Exception("Choose between " +
+                            ", ".join(sorted(BASEFLOW_METHODS)) +
+                            " baseflow methods.")
+        baseflow = BASEFLOW_METHODS[method](self.data[self._data_cols],
+                                            **params)
+        return self.__class__(baseflow, hemisphere=self._hemisphere,
+                              season_type=self._season_type,
+                              datacols=self._data_cols, copy=False,
+                              compact=self._compact)
+
 # %%
     def _control_extra_serie(self):
         """check if extra time serie fits with the current dataset
@@ -642,3 +1204,161 @@ class HydroAnalysis(object):
             True
 
         return True
+
+
+class HydroQuery(object):
+    '''
+    Lazy chain of selections on a HydroAnalysis object, created with
+    HydroAnalysis.lazy()
+
+    The selections are only recorded. When the data is requested (collect
+    or data), they are combined in a single boolean mask over the index of
+    the original object, which gives the same result as the chain of
+    HydroAnalysis selections without creating the intermediate objects.
+
+    Attributes
+    -----------
+    plan : list of tuple
+        the recorded selections, as (name, arguments)
+    '''
+
+    def __init__(self, hydroanalysis, plan=None):
+        self._source = hydroanalysis
+        if plan is None:
+            plan = []
+        self.plan = plan
+
+    def __repr__(self):
+        message = 'Lazy selection on ' + repr(self._source)
+        for name, args in self.plan:
+            message += '\n .' + name + str(args)
+        return message
+
+    def _add(self, name, *args):
+        """new query with an extra selection at the end of the plan
+        """
+        return self.__class__(self._source, self.plan + [(name, args)])
+
+    def get_date_range(self, start, end):
+        """see HydroAnalysis.get_date_range"""
+        return self._add("get_date_range", start, end)
+
+    def get_year(self, year):
+        """see HydroAnalysis.get_year"""
+        if (not isinstance(year, str)) or len(year) != 4:
+            raise TypeError("provide year in 4 character-string.")
+        return self._add("get_year", year)
+
+    def get_month(self, month):
+        """see HydroAnalysis.get_month"""
+        return self._add("get_month",
+                         self._source._existing_month(month))
+
+    def get_season(self, season):
+        """see HydroAnalysis.get_season"""
+        return self._add("get_season", season.capitalize())
+
+    def get_climbing(self):
+        """see HydroAnalysis.get_climbing"""
+        return self._add("get_climbing")
+
+    def get_recess(self):
+        """see HydroAnalysis.get_recess"""
+        return self._add("get_recess")
+
+    def get_above_percentile(self, percentile):
+        """see HydroAnalysis.get_above_percentile"""
+        return self._add("get_above_percentile", percentile)
+
+    def get_below_percentile(self, percentile):
+        """see HydroAnalysis.get_below_percentile"""
+        return self._add("get_below_percentile", percentile)
+
+    @property
+    def data(self):
+        """the data of the evaluated selection"""
+        return self.collect().data
+
+    def collect(self):
+        """
+        Evaluate the selections and return the result as a HydroAnalysis
+        object
+
+        Notes
+        ------
+        The evaluation keeps track of the selected row range [start, stop)
+        and a boolean mask of the selected values within this range. Date
+        selections narrow the range, month and season selections narrow
+        the range to the first and last selected row and mask the other
+        rows, value selections (climbing, recess, percentiles) only mask
+        values.
+        """
+        source = self._source
+        index = source.data.index
+        values = source.data[source._data_cols].values
+        start, stop = 0, len(index)
+        keep = np.ones(values.shape, dtype=bool)
+
+        for name, args in self.plan:
+            if name in ("get_date_range", "get_year"):
+                if name == "get_year":
+                    args = (args[0], args[0])
+                for date in args:
+                    self._check_date_range(date, index[start],
+                                           index[stop - 1])
+                bounds = index.slice_indexer(*args)
+                newstart = max(start, bounds.start)
+                newstop = min(stop, bounds.stop)
+                keep = keep[newstart - start:newstop - start]
+                start, stop = newstart, newstop
+
+            elif name in ("get_month", "get_season"):
+                if name == "get_month":
+                    rows = index[start:stop].month == args[0]
+                else:
+                    rows = source._season_labels().values[start:stop] == \
+                        args[0]
+                positions = np.flatnonzero(rows)
+                if positions.size == 0:
+                    raise Exception("Selection contains no data.")
+                keep = keep & rows.reshape(-1, 1)
+                keep = keep[positions[0]:positions[-1] + 1]
+                start, stop = start + positions[0], \
+                    start + positions[-1] + 1
+
+            elif name in ("get_climbing", "get_recess"):
+                current = values[start:stop]
+                change = np.full(current.shape, np.nan)
+                change[1:] = current[1:] - current[:-1]
+                previous = np.zeros(keep.shape, dtype=bool)
+                previous[1:] = keep[:-1]
+                if name == "get_climbing":
+                    keep = keep & previous & (change > 0.0)
+                else:
+                    keep = keep & previous & (change < 0.0)
+
+            else:
+                current = np.where(keep, values[start:stop], np.nan)
+                percentilevalue = np.array(
+                    [np.nanquantile(column, args[0])
+                     if not np.isnan(column).all() else np.nan
+                     for column in current.T])
+                if name == "get_above_percentile":
+                    keep = keep & (values[start:stop] > percentilevalue)
+                else:
+                    keep = keep & (values[start:stop] < percentilevalue)
+
+        if start >= stop:
+            raise Exception("Selection contains no data.")
+        selection = pd.DataFrame(keep, index=index[start:stop],
+                                 columns=source._data_cols)
+        return source._view(source.data.iloc[start:stop])._select_values(
+            selection)
+
+    @staticmethod
+    def _check_date_range(date2test, start_date, end_date):
+        """controller for date range, see HydroAnalysis._check_date_range
+        """
+        date2test = pd.to_datetime(date2test)
+        if date2test < start_date or date2test > end_date:
+            raise Exception("Provided date outside date range!")
@@ -8,73 +8,478 @@ Martin Roberge, mroberge@towson.edu
 from __future__ import absolute_import, print_function
 
 import os
-import sys
 import ftplib
-from io import StringIO
-import datetime
+import json
+import threading
+from io import StringIO, BytesIO
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 import numpy as np
 import pandas as pd
 import requests
 
 from . import exceptions
+from .store import write_store, _combine_columns
 
 
-def load_VMM_zrx_timeserie(filename):
+# known keywords of the ZRXP header, longest first to match e.g. CNAME
+# before CNR and SNAME before SANR
+_ZRX_KEYS = sorted(["ZRXPVERSION", "ZRXPCREATOR", "ZRXPMODE", "REXCHANGE",
+                    "SANR", "SNAME", "SWATER", "CDASA", "CDASANAME",
+                    "CCHANNEL", "CCHANNELNO", "CMW", "CNAME", "CNR", "CUNIT",
+                    "RINVAL", "RTIMELVL", "XVLID", "TSPATH", "CTAG",
+                    "CTAGKEY", "XTRUNCATE", "METCODE", "METERNUMBER",
+                    "EDIS", "TZ", "ZDATE", "LAYOUT", "TASKID",
+                    "SOURCESYSTEM", "SOURCEID", "USER", "ODS"],
+                   key=len, reverse=True)
+
+
+def _days_from_civil(year, month, day):
+    """
+    Vectorized number of days since 1970-01-01 of the given (proleptic
+    Gregorian) dates, using integer arithmetic only
+
+    Parameters
+    ----------
+    year, month, day : int or ndarray of int
+    """
+    year = np.asarray(year, dtype=np.int64)
+    month = np.asarray(month, dtype=np.int64)
+    day = np.asarray(day, dtype=np.int64)
+    # years starting in March, so the leap day is the last day of the year
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era*400
+    day_of_year = (153*((month + 9) % 12) + 2)//5 + day - 1
+    day_of_era = (year_of_era*365 + year_of_era//4 - year_of_era//100 +
+                  day_of_year)
+    return era*146097 + day_of_era - 719468
+
+
+def _zrx_stamps_to_datetime(stamps):
+    """
+    Convert integer yyyymmddHHMMSS time stamps to a pd.DatetimeIndex
+    """
+    stamps = np.asarray(stamps, dtype=np.int64)
+    date, time = np.divmod(stamps, 1000000)
+    days = _days_from_civil(date // 10000, date // 100 % 100, date % 100)
+    seconds = (days*86400 + time // 10000*3600 + time // 100 % 100*60 +
+               time % 100)
+    return pd.DatetimeIndex((seconds*10**9).astype('datetime64[ns]'),
+                            name='Time')
+
+
+def _parse_zrx_header(zrxf):
+    """
+    Read the header lines (starting with #) of an open zrx file and
+    put the file position at the first data line
+
+    Parameters
+    ----------
+    zrxf : file object
+        text file object, positioned at the start of the file
+
+    Returns
+    -------
+    header : dict
+        header keywords (e.g. SANR, SNAME, CUNIT, TZ, RINVAL) and values
+    """
+    header = {}
+    position = zrxf.tell()
+    line = zrxf.readline()
+    while line.startswith('#'):
+        for token in line.strip().lstrip('#').split('|*|'):
+            token = token.strip()
+            for key in _ZRX_KEYS:
+                if token.startswith(key):
+                    header.setdefault(key, token[len(key):].strip())
+                    break
+        position = zrxf.tell()
+        line = zrxf.readline()
+    zrxf.seek(position)
+    return header
+
+
+def _read_zrx_data(zrxf, header, name, chunksize=None):
+    """
+    Read the data lines of an open zrx file, positioned after the header,
+    as a pd.DataFrame or an iterator of pd.DataFrames of chunksize lines
+    """
+    data = pd.read_csv(zrxf, sep=' ', header=None, usecols=(0, 1),
+                       names=['Time', name], index_col=0,
+                       dtype={'Time': np.int64, name: np.float64},
+                       na_values=[header.get("RINVAL", "-777.0")],
+                       chunksize=chunksize)
+    if chunksize is None:
+        return _zrx_frame(data, header)
+    return (_zrx_frame(chunk, header) for chunk in data)
+
+
+def _zrx_frame(data, header):
+    """convert the zrx time stamps and add the header metadata"""
+    data.index = _zrx_stamps_to_datetime(data.index.values)
+    data.attrs.update(header)
+    return data
+
+
+def _zrx_name(filename):
+    """station name of a zrx file, i.e. the file name without extension"""
+    return os.path.splitext(os.path.basename(filename.replace("\\", "/")))[0]
+
+
+def read_VMM_zrx_header(filename):
+    """
+    Read the metadata in the header of a VMM zrx file
+
+    Parameters
+    ----------
+    filename : str
+        full path name to the file to read in
+
+    Returns
+    -------
+    header : dict
+        header keywords (e.g. SANR, SNAME, CUNIT, TZ, RINVAL) and values
+    """
+    with open(filename, 'r') as zrxf:
+        return _parse_zrx_header(zrxf)
+
+
+def load_VMM_zrx_timeserie(filename, chunksize=None):
     """
     Read VMM zrx files and converts it into a pd.DataFrame
 
+    The file is read in a single pass; the metadata of the header
+    (station, units, timezone,...) is added to the attrs of the
+    pd.DataFrame(s).
+
     Parameters
     ----------
     filename : str
         full path name to the file to read in
+    chunksize : None or int
+        when given, the data is read lazily as pd.DataFrames of
+        chunksize lines each, to process large files with bounded memory
 
     Returns
     -------
-    data : pd.DataFrame
+    data : pd.DataFrame or iterator of pd.DataFrame
         pd.DataFrame of the VMM data
     """
-    zrxf = open(filename, 'r')
-
-    # define header length (= number of lines with starting #)
-    ctestall = zrxf
-    headerlength = 0
-    ctest = '#'
-    while ctest == '#':
-        ctest = ctestall.readline()[0]
-        headerlength += 1
-    print('File ', filename.split("\\")[-1],
-          ' headerlength is: ', headerlength-1)
-    zrxf.close()
-
-    # Read the data
-    data = pd.read_table(filename, sep=' ',
-                         skiprows=headerlength-1, index_col=0,
-                         parse_dates=True,
-                         header=None, usecols=(0, 1),
-                         names=['Time', filename.split("\\")[-1][:-4]],
-                         na_values='-777.0')
+    if chunksize is not None:
+        return _iter_zrx_chunks(filename, chunksize)
+    with open(filename, 'r') as zrxf:
+        header = _parse_zrx_header(zrxf)
+        return _read_zrx_data(zrxf, header, _zrx_name(filename))
+
+
+def _iter_zrx_chunks(filename, chunksize):
+    """generator keeping the zrx file open while reading the chunks"""
+    with open(filename, 'r') as zrxf:
+        header = _parse_zrx_header(zrxf)
+        for chunk in _read_zrx_data(zrxf, header, _zrx_name(filename),
+                                    chunksize=chunksize):
+            yield chunk
+
+
+class LocalZrxSource(object):
+    """
+    Collection of zrx files in a local directory
+
+    Parameters
+    ----------
+    path : str
+        directory with the zrx files
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def list(self):
+        """sorted names of the zrx files in the source"""
+        return sorted(zrxf for zrxf in os.listdir(self.path)
+                      if zrxf.endswith('.zrx'))
+
+    def stat(self):
+        """size and modification time of the zrx files in the source"""
+        status = {}
+        for zrxf in self.list():
+            info = os.stat(os.path.join(self.path, zrxf))
+            status[zrxf] = {'size': info.st_size,
+                            'modify': "{:.6f}".format(info.st_mtime)}
+        return status
+
+    def fetch(self, name, offset=0):
+        """content of the zrx file name as bytes, starting at offset"""
+        with open(os.path.join(self.path, name), 'rb') as zrxf:
+            zrxf.seek(offset)
+            return zrxf.read()
+
+
+class FtpZrxSource(object):
+    """
+    Collection of zrx files in a folder of a ftp server
+
+    The files are fetched with binary transfers over a small pool of
+    persistent connections, so multiple files can be downloaded
+    concurrently (see fetch_many) without logging in for every file.
+
+    Parameters
+    ----------
+    server : str
+        ftp server location, e.g. ftp.anteagroup.be
+    login : str
+        login name of the ftp drive
+    password : str
+        password of the user
+    path : str
+        path name to the folder with the interested .zrx files
+    connections : int
+        maximum number of simultaneous connections to the server
+    ftp_factory : callable
+        returns a new (not logged in) connection for the server name,
+        ftplib.FTP by default
+    """
+
+    def __init__(self, server, login, password, path, connections=4,
+                 ftp_factory=ftplib.FTP):
+        self.server = server
+        self.login = login
+        self.password = password
+        self.path = path
+        self.connections = connections
+        self.ftp_factory = ftp_factory
+        self._pool = queue.Queue()
+        self._lock = threading.Lock()
+        self._opened = 0
+
+    def _connect(self):
+        ftp = self.ftp_factory(self.server)
+        ftp.login(self.login, self.password)
+        ftp.cwd(self.path)
+        return ftp
+
+    def _acquire(self):
+        """take an idle connection, or open a new one when allowed"""
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.connections:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        return self._pool.get()
+
+    def _discard(self, ftp):
+        """close a broken connection, so a new one can take its place"""
+        with self._lock:
+            self._opened -= 1
+        try:
+            ftp.close()
+        except Exception:
+            pass
+
+    def _run(self, command):
+        """run command(ftp) on a pooled connection, retry once on a
+        broken connection"""
+        for attempt in range(2):
+            ftp = self._acquire()
+            try:
+                result = command(ftp)
+            except ftplib.error_perm:
+                # the connection is fine, the request is not
+                self._pool.put(ftp)
+                raise
+            except ftplib.all_errors:
+                self._discard(ftp)
+                if attempt:
+                    raise
+            except Exception:
+                self._pool.put(ftp)
+                raise
+            else:
+                self._pool.put(ftp)
+                return result
+
+    def list(self):
+        """sorted names of the zrx files in the source"""
+        return sorted(zrxf for zrxf in self._run(lambda ftp: ftp.nlst())
+                      if zrxf.endswith('.zrx'))
+
+    def stat(self):
+        """
+        size and modification time of the zrx files in the source, from a
+        single MLSD listing or else from SIZE and MDTM per file
+        """
+        def listing(ftp):
+            try:
+                return dict((name, {'size': int(facts['size']),
+                                    'modify': facts['modify']})
+                            for name, facts in ftp.mlsd(facts=['size',
+                                                               'modify'])
+                            if name.endswith('.zrx'))
+            except (ftplib.error_perm, KeyError):
+                # server without (complete) MLSD support
+                pass
+            ftp.voidcmd('TYPE I')
+            return dict((name, {'size': ftp.size(name),
+                                'modify': ftp.sendcmd('MDTM ' +
+                                                      name).split()[-1]})
+                        for name in ftp.nlst() if name.endswith('.zrx'))
+        return self._run(listing)
+
+    def fetch(self, name, offset=0):
+        """content of the zrx file name as bytes, starting at offset"""
+        def retrieve(ftp):
+            output = BytesIO()
+            ftp.retrbinary("RETR " + name, output.write,
+                           rest=offset or None)
+            return output.getvalue()
+        return self._run(retrieve)
+
+    def fetch_many(self, names, offsets=None):
+        """
+        Fetch the files concurrently over the pool of connections
+
+        Returns an iterator of (name, content) tuples in the order of names
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        if offsets is None:
+            offsets = [0]*len(names)
+        with ThreadPoolExecutor(max_workers=self.connections) as executor:
+            for name, content in zip(names, executor.map(self.fetch, names,
+                                                         offsets)):
+                yield name, content
+
+    def close(self):
+        """close all idle connections of the pool"""
+        while True:
+            try:
+                ftp = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._opened -= 1
+            try:
+                ftp.quit()
+            except ftplib.all_errors:
+                ftp.close()
+
+    def __getstate__(self):
+        # connections can not be shared with other processes
+        state = self.__dict__.copy()
+        for key in ['_pool', '_lock', '_opened']:
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._pool = queue.Queue()
+        self._lock = threading.Lock()
+        self._opened = 0
+
+
+def _parse_zrx_content(content, name):
+    """
+    Parse the bytes of a zrx file into the time stamps (as int64
+    nanoseconds), the values and the header of the file
+    """
+    zrxf = StringIO(content.decode('latin-1'))
+    header = _parse_zrx_header(zrxf)
+    data = _read_zrx_data(zrxf, header, name)
+    return (data.index.values.astype('datetime64[ns]').view(np.int64),
+            data[name].values, header)
+
+
+def _fetch_and_parse_zrx(task):
+    """ tuple -> tuple
+    Worker function: fetch a single zrx file of the source and parse it
+    """
+    source, name = task
+    return _parse_zrx_content(source.fetch(name), _zrx_name(name))
+
+
+def _parse_zrx_task(task):
+    """ tuple -> tuple
+    Worker function: parse the already fetched content of a zrx file
+    """
+    name, content = task
+    return _parse_zrx_content(content, _zrx_name(name))
+
+
+def _align_series(names, parsed):
+    """
+    Combine the parsed (stamps, values, header) of the stations into a
+    single pd.DataFrame on the union of all time stamps, filled in a
+    single allocation
+    """
+    data = _combine_columns(names, [times for times, _, _ in parsed],
+                            [serie for _, serie, _ in parsed])
+    data.attrs.update(dict((name, header) for name, (_, _, header)
+                           in zip(names, parsed)))
     return data
 
 
-def _gettext(ftp, filename, outfile=None):
+def load_VMM_zrx_timeseries(source, processes=None):
     """
-    Help function for scraping text from the ftp-driver
-    (for binary data, another format would be needed)
+    Read all VMM zrx files of a source (local directory or ftp folder)
+    in a pool of processes and combine them into a single pd.DataFrame
 
+    Parameters
+    ----------
+    source : str, LocalZrxSource or FtpZrxSource
+        source of the zrx files, a str is interpreted as a local directory.
+        Any object with a list() method returning the file names and a
+        fetch(name) method returning the content of a file as bytes can
+        be used, as long as it can be pickled. Sources with a
+        fetch_many(names) method (e.g. FtpZrxSource) download the files
+        concurrently in the main process, while the pool parses them
+    processes : None or int
+        number of worker processes, by default the number of CPUs
+
+    Returns
+    -------
+    data : pd.DataFrame
+        pd.DataFrame of the VMM data, with a column per file on the union
+        of the time stamps of all files. The header metadata of each file
+        is available in data.attrs[column name]
     """
-    # fetch a text file
-    if outfile is None:
-        outfile = sys.stdout
-    # use a lambda to add newlines to the lines read from the server
-    ftp.retrlines("RETR " + filename, lambda s, w=outfile.write: w(s+"\n"))
+    from concurrent.futures import ProcessPoolExecutor
+
+    if isinstance(source, str):
+        source = LocalZrxSource(source)
+    files = source.list()
+    if not files:
+        raise Exception("No zrx files found in the source")
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        if hasattr(source, 'fetch_many'):
+            # parse the files while the next ones are downloading
+            futures = [executor.submit(_parse_zrx_task, task)
+                       for task in source.fetch_many(files)]
+            parsed = [future.result() for future in futures]
+        else:
+            tasks = [(source, zrxf) for zrxf in files]
+            parsed = list(executor.map(_fetch_and_parse_zrx, tasks))
+    return _align_series([_zrx_name(zrxf) for zrxf in files], parsed)
 
 
 def load_VMM_zrx_timeseries_from_ftp(server, login, password,
-                                     path, dataname="_DATA"):
+                                     path, store=None,
+                                     processes=None, connections=4):
     """
     Read all VMM zrx files in a specific folder, concatenates them
-    and converts it into a pd.DataFrame
+    and converts it into a pd.DataFrame, which is saved in a hydropy
+    store for next time working with these
 
     Parameters
     ----------
@@ -86,89 +491,172 @@ def load_VMM_zrx_timeseries_from_ftp(server, login, password,
         password of the user
     path : str
         path name to the folder with the interested .zrx files
-    dataname : str
-        suffix name used to flag the saved data
+    store : None or str
+        directory of the hydropy store to save the data in (see
+        hydropy.store), nothing is saved when None
+    processes : None or int
+        number of worker processes, by default the number of CPUs
+    connections : int
+        number of simultaneous connections to the ftp server
 
     Returns
     -------
     data : pd.DataFrame
         pd.DataFrame of the VMM data
     """
-    ftp = ftplib.FTP(server)
-    ftp.login(login, password)
-    # discharge -> go to discharge folder
-    ftp.cwd(path)
-    # check the files in the folder
-    files = ftp.nlst()
-
-    # We're interested in the .zrx files, so let's get the information of
-    # those in a dictionary, with the key the station code and the data a
-    # pandas Dataframe first exclude in the files list the none-zrx files
-    files = [zrxf for zrxf in files if '.zrx' in zrxf]
-
-    data = []
-    for zrxf in files:
-        output = StringIO.StringIO()
-        _gettext(ftp, zrxf, output)
+    source = FtpZrxSource(server, login, password, path,
+                          connections=connections)
+    try:
+        data = load_VMM_zrx_timeseries(source, processes=processes)
+    finally:
+        source.close()
+
+    if store is not None:
+        write_store(data, store)
+    return data
 
-        # define header length (= number of lines with starting #)
-        ctestall = StringIO.StringIO(output.getvalue())
-        headerlength = 0
-        ctest = '#'
-        while ctest == '#':
-            ctest = ctestall.readline()[0]
-            headerlength += 1
-        print('File ', zrxf, ' headerlength is: ', headerlength-1)
 
-        temp = pd.read_table(StringIO.StringIO(output.getvalue()), sep=' ',
-                             skiprows=headerlength-1, index_col=0,
-                             parse_dates=True,
-                             header=None, usecols=(0, 1),
-                             names=['Time', zrxf[:-4]], na_values='-777.0')
-        data.append(temp)
-        output.close()
-    ftp.close()
+def _read_manifest(store):
+    """manifest of a sync store, empty when the store is new"""
+    manifest = os.path.join(store, 'manifest.json')
+    if not os.path.exists(manifest):
+        return {'files': {}, 'stations': {}}
+    with open(manifest, 'r') as jsonf:
+        return json.load(jsonf)
 
-    # CONCATENATE THE DIFFERENT DATAFRAMES IN ONE BIG:
-    data2 = pd.concat(data, axis=1)
 
-    # SAVE THE DATA IN ONE PICKLE FOR NEXT TIME WORKING WITH THESE
-    data2.to_csv(datetime.datetime.now().strftime("%Y%m%d") +
-                 "VMM_" + dataname+".csv", float_format="%.3f",
-                 na_rep="Nan")
-    data2.to_pickle(datetime.datetime.now().strftime("%Y%m%d") +
-                    "VMM_" + dataname)
+def _write_manifest(store, state):
+    """replace the manifest of a sync store"""
+    manifest = os.path.join(store, 'manifest.json')
+    with open(manifest + '.tmp', 'w') as jsonf:
+        json.dump(state, jsonf, indent=1, sort_keys=True)
+    os.replace(manifest + '.tmp', manifest)
 
 
-def _minutes2hours(minutes):
-    """convert minutes to hours and return als rest
+def sync_VMM_zrx_timeseries(source, store):
     """
-    return minutes/60, minutes % 60
+    Incrementally synchronise the zrx files of a source into a hydropy
+    store (see hydropy.store), instead of downloading all data again
 
+    A manifest in the store keeps the size and modification time of every
+    file and the last time stamp stored for every station. Unchanged files
+    are not fetched, files that have grown are fetched from the last
+    complete line on (ftp REST) and other changed files are fetched
+    completely. Only the rows after the last stored time stamp are
+    added to the store.
+
+    Parameters
+    ----------
+    source : str, LocalZrxSource or FtpZrxSource
+        source of the zrx files, a str is interpreted as a local directory.
+        The source needs a stat() method and a fetch(name, offset) method
+    store : str
+        directory of the hydropy store, created when not existing
 
-def load_CEH_timeserie(filename):
+    Returns
+    -------
+    new_rows : dict
+        number of rows added per station
     """
-    Read VMM zrx files and converts it into a pd.DataFrame
+    if isinstance(source, str):
+        source = LocalZrxSource(source)
+    if not os.path.exists(store):
+        os.makedirs(store)
+    state = _read_manifest(store)
+
+    names, offsets = [], []
+    status = source.stat()
+    for name in sorted(status):
+        known = state['files'].get(name)
+        if known is not None and known['size'] == status[name]['size'] and \
+                known['modify'] == status[name]['modify']:
+            continue
+        names.append(name)
+        # only resume appended files, rewritten ones are fetched again
+        if known is not None and status[name]['size'] > known['size']:
+            offsets.append(known['offset'])
+        else:
+            offsets.append(0)
+
+    if hasattr(source, 'fetch_many'):
+        contents = source.fetch_many(names, offsets)
+    else:
+        contents = ((name, source.fetch(name, offset))
+                    for name, offset in zip(names, offsets))
+
+    new_rows = {}
+    for offset, (name, content) in zip(offsets, contents):
+        station = _zrx_name(name)
+        # leave an incomplete last line for the next synchronisation
+        complete = content.rfind(b'\n') + 1
+        zrxf = StringIO(content[:complete].decode('latin-1'))
+        if offset:
+            header = state['files'][name]['header']
+        else:
+            header = _parse_zrx_header(zrxf)
+        data = _read_zrx_data(zrxf, header, station)
+
+        last = state['stations'].get(station)
+        if last is not None:
+            data = data[data.index > pd.Timestamp(last)]
+        data = data[~data.index.duplicated(keep='last')].sort_index()
+        if len(data):
+            write_store(data, store)
+            state['stations'][station] = str(data.index[-1])
+        new_rows[station] = len(data)
+        state['files'][name] = {'size': status[name]['size'],
+                                'modify': status[name]['modify'],
+                                'offset': offset + complete,
+                                'header': header}
+        # keep the manifest in line with the station files after each file
+        _write_manifest(store, state)
+
+    return new_rows
+
+
+def load_CEH_timeserie(filename, dtype=None, usecols=None):
+    """
+    Read CEH files and converts it into a pd.DataFrame
+
+    The date of each row is given by the year, month, day and minute of
+    the day in the second till fifth column, which are combined into the
+    Datetime index with vectorized integer arithmetic.
 
     Parameters
     ----------
     filename : str
         full path name to the file to read in
+    dtype : None, type or dict
+        data type(s) of the data columns, passed to pd.read_csv
+    usecols : None or list of str
+        names of the (non-date) columns to read, by default all columns
 
     Returns
     -------
     data : pd.DataFrame
-        pd.DataFrame of the VMM data
+        pd.DataFrame of the CEH data
     """
-    parse = lambda y,m,d,h: datetime.datetime(int(y), int(m), int(d),
-                                              _minutes2hours(int(h))[0],
-                                              _minutes2hours(int(h))[1])
-    ceh_data = pd.read_csv(filename, sep=',',
-                           parse_dates={"Datetime": [1, 2, 3, 4]},
-                           date_parser=parse,
+    names = list(pd.read_csv(filename, sep=',', nrows=0,
+                             skipinitialspace=True).columns)
+    datecols = names[1:5]
+    if usecols is not None:
+        usecols = [name for name in names
+                   if name in datecols or name in usecols]
+
+    types = dict((name, np.int64) for name in datecols)
+    if isinstance(dtype, dict):
+        types.update(dtype)
+    elif dtype is not None:
+        types.update((name, dtype) for name in names
+                     if name not in datecols)
+    ceh_data = pd.read_csv(filename, sep=',', usecols=usecols, dtype=types,
                            skipinitialspace=True)
-    ceh_data = ceh_data.set_index("Datetime")
 
+    year, month, day, minutes = [ceh_data.pop(name).values
+                                 for name in datecols]
+    stamps = (_days_from_civil(year, month, day)*1440 + minutes)*60*10**9
+    ceh_data.index = pd.DatetimeIndex(stamps.astype('datetime64[ns]'),
+                                      name='Datetime')
     return ceh_data
 
 
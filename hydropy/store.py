@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Local columnar store for hydropy time series
+
+The store is a directory with a Parquet file per station and year::
+
+    store/station=<name>/year=<yyyy>/data.parquet
+
+each file containing a time and a value column, so selections of stations
+and periods only read the files of the requested stations and years.
+"""
+from __future__ import absolute_import, print_function
+
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+_DATAFILE = 'data.parquet'
+
+
+def _check_pyarrow():
+    if pq is None:
+        raise Exception('The hydropy store requires pyarrow, install it '
+                        'with pip install pyarrow')
+
+
+def _combine_columns(names, stamps, values):
+    """
+    Combine the int64 nanosecond time stamps and the values of each
+    station into a single pd.DataFrame on the union of all time stamps,
+    filled in a single allocation
+    """
+    if len(names):
+        union = np.unique(np.concatenate(stamps))
+    else:
+        union = np.array([], dtype=np.int64)
+    data = np.full((len(union), len(names)), np.nan)
+    for col, (times, serie) in enumerate(zip(stamps, values)):
+        data[np.searchsorted(union, times), col] = serie
+    index = pd.DatetimeIndex(union.view('datetime64[ns]'), name='Time')
+    return pd.DataFrame(data, columns=names, index=index, copy=False)
+
+
+def _partition(path, station, year):
+    return os.path.join(path, 'station={}'.format(station),
+                        'year={}'.format(year), _DATAFILE)
+
+
+def _read_partition(filename, start=None, end=None):
+    """time stamps (int64 ns) and values of a single station-year file"""
+    table = pq.read_table(filename, columns=['time', 'value'])
+    times = table.column('time').to_numpy().astype('datetime64[ns]')
+    times = times.view(np.int64)
+    values = table.column('value').to_numpy()
+    if start is not None or end is not None:
+        first = 0 if start is None else np.searchsorted(times, start.value)
+        last = len(times) if end is None else \
+            np.searchsorted(times, end.value, side='right')
+        times, values = times[first:last], values[first:last]
+    return times, values
+
+
+def _write_partition(filename, times, values):
+    if not os.path.exists(os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+    table = pa.table({'time': pa.array(times.view('datetime64[ns]')),
+                      'value': pa.array(values, type=pa.float64())})
+    pq.write_table(table, filename)
+
+
+def write_store(data, path, mode='append'):
+    """
+    Write the time series of a pd.DataFrame (a column per station) to the
+    store, a file per station and year
+
+    Parameters
+    ----------
+    data : pd.DataFrame or pd.Series
+        time series with a DatetimeIndex and the station names as columns
+    path : str
+        directory of the store, created when not existing
+    mode : 'append' or 'overwrite'
+        with append, the stored data of the written years is kept and
+        updated with the new values; with overwrite, the written years
+        of the stations are replaced
+    """
+    _check_pyarrow()
+    if mode not in ['append', 'overwrite']:
+        raise Exception("mode should be 'append' or 'overwrite'")
+    if isinstance(data, pd.Series):
+        data = data.to_frame()
+
+    data = data.sort_index()
+    stamps = data.index.values.astype('datetime64[ns]').view(np.int64)
+    years = data.index.year.values
+    # row positions where a new year starts
+    bounds = np.r_[0, np.flatnonzero(np.diff(years)) + 1, len(years)]
+    for station in data.columns:
+        values = data[station].to_numpy(dtype=np.float64)
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            times, serie = stamps[first:last], values[first:last]
+            filename = _partition(path, station, years[first])
+            if mode == 'append' and os.path.exists(filename):
+                stored_times, stored = _read_partition(filename)
+                # new values replace the stored values of the same time
+                keep = ~np.isin(stored_times, times)
+                times = np.concatenate([stored_times[keep], times])
+                serie = np.concatenate([stored[keep], serie])
+                order = np.argsort(times, kind='mergesort')
+                times, serie = times[order], serie[order]
+            if len(times):
+                _write_partition(filename, times, serie)
+
+
+def store_stations(path):
+    """
+    Names of the stations available in the store
+
+    Parameters
+    ----------
+    path : str
+        directory of the store
+    """
+    if not os.path.isdir(path):
+        return []
+    return sorted(name[len('station='):] for name in os.listdir(path)
+                  if name.startswith('station='))
+
+
+def read_store(path, stations=None, start=None, end=None):
+    """
+    Read the time series of the store in a pd.DataFrame, only the files of
+    the requested stations and years are read
+
+    Parameters
+    ----------
+    path : str
+        directory of the store
+    stations : None, str or list of str
+        names of the stations to read, by default all stations
+    start, end : None, str or datetime
+        first and last date of the period to read, by default the whole
+        period. As in pandas, a str end includes the whole period it
+        describes, e.g. '2010' ends at the end of 2010
+
+    Returns
+    -------
+    data : pd.DataFrame
+        time series with a column per station
+    """
+    _check_pyarrow()
+    if stations is None:
+        stations = store_stations(path)
+    elif isinstance(stations, str):
+        stations = [stations]
+    start = None if start is None else pd.Timestamp(start)
+    if isinstance(end, str):
+        end = pd.Period(end).end_time
+    elif end is not None:
+        end = pd.Timestamp(end)
+
+    stamps, values = [], []
+    for station in stations:
+        folder = os.path.join(path, 'station={}'.format(station))
+        if not os.path.isdir(folder):
+            raise Exception('Station {} not in the store'.format(station))
+        years = sorted(int(name[len('year='):]) for name in
+                       os.listdir(folder) if name.startswith('year='))
+        parts = [_read_partition(_partition(path, station, year), start, end)
+                 for year in years
+                 if (start is None or year >= start.year) and
+                 (end is None or year <= end.year)]
+        stamps.append(np.concatenate([part[0] for part in parts] +
+                                     [np.array([], dtype=np.int64)]))
+        values.append(np.concatenate([part[1] for part in parts] +
+                                     [np.array([])]))
+    return _combine_columns(list(stations), stamps, values)
@@ -16,9 +16,59 @@ from matplotlib.ticker import LinearLocator
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 import matplotlib as mpl
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 mpl.rcParams['mathtext.default'] = 'regular'
 
 
+def _storm_peaks(flowserie, number_of_storms, min_period_in_between):
+    """ (pd.Series, int, int) -> np.ndarray
+    Positions of the largest flow values which are at least
+    min_period_in_between days from each other, from the largest
+    value down (greedy selection).
+
+    The candidates are the largest values found with a partial sort
+    (np.partition), growing the number of candidates when needed. Every
+    selected storm suppresses the positions within min_period_in_between
+    days around it, so each candidate is checked in O(1).
+    """
+    # fill na values with very low (negative) value
+    values = flowserie.fillna(value=-777.).values.astype(float)
+    times = flowserie.index.values
+    period = np.timedelta64(datetime.timedelta(days=min_period_in_between))
+
+    suppressed = np.zeros(values.size, dtype=bool)
+    stormmax = []
+    checked = 0
+    ncandidates = min(values.size, 4*number_of_storms)
+    while len(stormmax) < number_of_storms:
+        if checked == values.size:
+            raise Exception('Not enough storms with ' +
+                            str(min_period_in_between) +
+                            ' days in between found.')
+        # all values equal to or larger than the ncandidates-th largest,
+        # sorted from large to small and on time for equal values
+        threshold = np.partition(values, values.size - ncandidates)[
+            values.size - ncandidates]
+        candidates = np.flatnonzero(values >= threshold)
+        candidates = candidates[np.argsort(-values[candidates],
+                                           kind='mergesort')]
+
+        for position in candidates[checked:]:
+            if not suppressed[position]:
+                stormmax.append(position)
+                if len(stormmax) == number_of_storms:
+                    break
+                suppressed[times.searchsorted(times[position] - period,
+                                              side='right'):
+                           times.searchsorted(times[position] + period,
+                                              side='left')] = True
+        checked = candidates.size
+        ncandidates = min(values.size, 2*ncandidates)
+
+    return np.array(stormmax)
+
+
 def selectstorms(flowserie, rainserie, number_of_storms=3,
                  min_period_in_between=7, search_period=7,
                  drywindow=96):
@@ -53,77 +103,14 @@ def selectstorms(flowserie, rainserie, number_of_storms=3,
     if not isinstance(rainserie, pd.Series):
         raise Exception('rainserie is a single data Series')
 
-    # fill na values with very low (negative) value
-    temp = flowserie.fillna(value=-777.).copy()
-    # sort the whole array
-    try:
-        temp = temp.sort(temp.columns.tolist(), ascending=False)
-    except:
-        temp.sort(ascending=False)
-
-    # find in the index three periods which are at least given number
-    # of days from each other
-    # after three concurrences, save these dates
-    stormmax = [temp.index[0]]  # first element is a selected storm
-    i = 1
-    while len(stormmax) < number_of_storms:
-        # check for each period
-        alldif = True
-        for stormdate in stormmax:
-            if abs(temp.index[i] - stormdate) \
-                    < datetime.timedelta(days=min_period_in_between):
-                alldif = False
-        # if new stormperiod, select
-        if alldif:
-            stormmax.append(temp.index[i])
-        i += 1
+    stormmax = flowserie.index[_storm_peaks(flowserie, number_of_storms,
+                                            min_period_in_between)]
 
-    selstorms = []
-    for storm in stormmax:
-        # FIND DRY DAY WEEK BEFORE
-        # select period before storm (1 week)
-        presearchperiod = datetime.timedelta(days=search_period)
-        temp1 = rainserie[storm - presearchperiod:storm]
-        temp1 = pd.rolling_sum(temp1, window=drywindow, center=False)
-        # zero value means the preceding 24hours no rain: so, closest zeros
-        # to the date itself -24h are selected
-        if rainserie.ndim == 2:
-            temp1 = temp1.min(axis=1)
-        tempdates = temp1[temp1 < 0.001].index.tolist()
-        if len(tempdates) == 0:
-            raise Exception('Decrease drywindow period containing no rain.')
-
-        date_arg = np.argmin([abs(times - storm) for times in tempdates])
-        startstormdate = tempdates[date_arg] - Day()
-
-        # Get the flow value of the storm and when it is found again + 1 Day
-        temp2a = flowserie[startstormdate:startstormdate + Week()*2]
-
-        # only if multiple columns
-        if flowserie.ndim == 2:
-            temp2 = temp2a.max(axis=1)
-        else:
-            temp2 = temp2a
-
-        flowbase = temp2.ix[startstormdate]
-        lowerafterstorm = temp2[temp2 < flowbase][storm + Day():]
-        if lowerafterstorm.size == 0:
-            print('Lower initial flow not found again...test with mean...')
-            if flowserie.ndim == 2:
-                temp2 = temp2a.mean(axis=1)
-            else:
-                temp2 = temp2a
-            flowbase = temp2.ix[startstormdate]
-            lowerafterstorm = temp2[temp2 < flowbase][storm + Day():]
-        cnt = 1
-        while lowerafterstorm.size == 0:
-            print('...    still not working; relaxing conditions...',
-                  cnt*10, '% of minimal after storm incorporated')
-            flowbase = flowbase + 0.1*flowbase
-            lowerafterstorm = temp2[temp2 < flowbase][storm + Day():]
-            cnt += 1
-        endstormdate = lowerafterstorm.index[0]
+    startdates = _storm_starts(rainserie, stormmax, search_period, drywindow)
+    enddates = _storm_ends(flowserie, startdates, stormmax)
 
+    selstorms = []
+    for startstormdate, endstormdate in zip(startdates, enddates):
         # add to selected storms
         selstorms.append({'startdate': startstormdate,
                           'enddate': endstormdate})
@@ -131,6 +118,323 @@ def selectstorms(flowserie, rainserie, number_of_storms=3,
     return selstorms
 
 
+def _storm_starts(rainserie, stormdates, search_period, drywindow):
+    """ (pd.Series, pd.DatetimeIndex, int, int) -> pd.DatetimeIndex
+    Start dates of the storms: one day before the last moment within the
+    search period before the storm which closes a dry window (no rain
+    during drywindow time steps).
+
+    The rolling rain sum is computed once for the whole serie, the last
+    dry moment before each position follows from a cumulative maximum, so
+    all storms are handled with integer position lookups.
+    """
+    drysum = rainserie.rolling(window=drywindow).sum().values
+    positions = np.arange(drysum.size)
+    lastdry = np.maximum.accumulate(np.where(drysum < 0.001, positions, -1))
+
+    times = rainserie.index
+    stops = times.searchsorted(stormdates, side='right') - 1
+    firsts = times.searchsorted(
+        stormdates - pd.Timedelta(days=search_period), side='left')
+
+    # the dry window should be inside the search period
+    candidates = lastdry[np.maximum(stops, 0)]
+    if ((stops < 0) | (candidates < firsts + drywindow - 1)).any():
+        raise Exception('Decrease drywindow period containing no rain.')
+    return times[candidates] - Day()
+
+
+def _relaxation_steps(flowbase, minimum):
+    """ (np.ndarray, np.ndarray) -> np.ndarray
+    Number of times the flowbase needs to be increased with 10% before
+    it exceeds the minimum, solved analytically (0 when already larger)
+    """
+    relax = ~(minimum < flowbase)
+    if (relax & ~((flowbase > 0.) & np.isfinite(minimum))).any():
+        raise Exception('Flow does not get back to the flow at the start '
+                        'of the storm.')
+    ratio = np.where(relax, minimum / np.where(relax, flowbase, 1.), 1.)
+    steps = np.ceil(np.log(ratio) / np.log(1.1)).astype(int)
+    # correct for rounding of the logarithm
+    steps = np.where(flowbase * 1.1**steps > minimum, steps, steps + 1)
+    steps = np.where((steps > 0) & (flowbase * 1.1**(steps - 1) > minimum),
+                     steps - 1, steps)
+    return np.where(relax, steps, 0)
+
+
+def _storm_ends(flowserie, startdates, stormdates):
+    """ (pd.Series, pd.DatetimeIndex, pd.DatetimeIndex) -> pd.DatetimeIndex
+    End dates of the storms: the first moment from one day after the storm
+    till two weeks after the start of the storm with a flow lower than the
+    flow at the start of the storm (Qbase). If none is found, the Qbase is
+    relaxed (1.1*Qbase; 1.21*Qbase,...) until a moment is found.
+
+    All storms are handled at once on a 2-D array of the flow windows.
+    """
+    times = flowserie.index
+    values = flowserie.values.astype(float)
+
+    basepositions = times.get_indexer(startdates)
+    if (basepositions < 0).any():
+        raise Exception('Start date of the storm not in the flowserie.')
+    flowbase = values[basepositions]
+
+    firsts = times.searchsorted(stormdates + Day(), side='left')
+    stops = times.searchsorted(startdates + Week()*2, side='right')
+    if (stops <= firsts).any():
+        raise Exception('No flow data after the storm.')
+
+    positions = firsts.reshape(-1, 1) + np.arange((stops - firsts).max())
+    inwindow = positions < stops.reshape(-1, 1)
+    positions = np.where(inwindow, positions, 0)
+    windows = np.where(inwindow, values[positions], np.nan)
+
+    minimum = np.fmin.reduce(windows, axis=1)
+    steps = _relaxation_steps(flowbase, minimum)
+    for storm, step in zip(stormdates[steps > 0], steps[steps > 0]):
+        print('Lower initial flow not found again after storm', storm,
+              '; relaxing conditions...', step*10,
+              '% of minimal after storm incorporated')
+
+    below = windows < (flowbase * 1.1**steps).reshape(-1, 1)
+    ends = positions[np.arange(positions.shape[0]), below.argmax(axis=1)]
+    return times[ends]
+
+
+def segmentstorms(flowserie, rainserie, drywindow=96, max_duration=14,
+                  rain_threshold=0.001):
+    """ (pd.Series, pd.Series) -> (pd.Series, pd.DataFrame)
+    Segment the whole flow timeserie into rain-runoff events, using the
+    same dry window and return-to-base logic as selectstorms.
+
+    An event starts at rain after a dry window (no rain during drywindow
+    time steps), when the flow from then on rises above the flow at the
+    last dry time step (Qbase). The event ends at the first moment after
+    the rise with a flow lower than Qbase, within max_duration days after
+    the start. If none is found, Qbase is relaxed (1.1*Qbase;
+    1.21*Qbase,...) as in selectstorms. A new event can only start after
+    the end of the previous one.
+
+    Parameters
+    ----------
+    flowserie : pd.Series
+        Pandas Series with the date in the index
+    rainserie : pd.Series
+        Pandas Series with the date in the index, on the same time steps
+        as the flowserie (missing rain values are handled as no rain)
+    drywindow : int
+        Number of timesteps to check for no-rain
+    max_duration : int (days)
+        Maximum duration of an event
+    rain_threshold : float
+        Rain (sum) below this value is handled as no rain
+
+    Returns
+    -------
+    eventids : pd.Series
+        event number for every time step of the flowserie, -1 outside
+        the events
+    events : pd.DataFrame
+        one row per event with the start, peak and end date, the duration,
+        peak flow, volume (flow integrated over time, in flow units times
+        seconds), peak rain and total rain
+    """
+    if not isinstance(flowserie, pd.Series):
+        raise Exception('flowserie is a single data Series')
+    if not isinstance(rainserie, pd.Series):
+        raise Exception('rainserie is a single data Series')
+
+    times = flowserie.index
+    flow = flowserie.values.astype(float)
+    rain = rainserie.reindex(times).fillna(0.).values.astype(float)
+
+    # candidate starts: rain after a dry window
+    drysum = pd.Series(rain).rolling(window=drywindow).sum().values
+    candidates = np.flatnonzero((rain[drywindow:] >= rain_threshold) &
+                                (drysum[drywindow - 1:-1] < rain_threshold))
+    candidates += drywindow
+    stops = times.searchsorted(times[candidates] +
+                               pd.Timedelta(days=max_duration),
+                               side='right')
+
+    # cumulative sums for the volume and rain totals of the events
+    steps = np.diff(times.values).astype('timedelta64[ns]').astype(float)
+    steps = np.append(steps, np.median(steps)) * 1e-9
+    cumvolume = np.concatenate([[0.], np.nancumsum(flow * steps)])
+    cumrain = np.concatenate([[0.], np.cumsum(rain)])
+
+    events = []
+    eventids = np.full(flow.size, -1, dtype=np.int64)
+    available = 0
+    for start, stop in zip(candidates, stops):
+        if start < available:
+            continue
+        # Qbase before the rain, the flow can already rise at the start
+        flowbase = flow[start - 1]
+        rising = flow[start:stop] > flowbase
+        if not rising.any():
+            continue
+        rise = start + rising.argmax()
+
+        after = flow[rise + 1:stop]
+        if after.size == 0 or np.isnan(after).all():
+            end = stop - 1
+        else:
+            minimum = np.nanmin(after)
+            if minimum < flowbase:
+                threshold = flowbase
+            elif flowbase > 0.:
+                threshold = flowbase * 1.1**_relaxation_steps(
+                    np.array([flowbase]), np.array([minimum]))[0]
+            else:
+                threshold = np.nextafter(minimum, np.inf)
+            end = rise + 1 + (after < threshold).argmax()
+
+        peak = start + np.nanargmax(flow[start:end + 1])
+        eventids[start:end + 1] = len(events)
+        events.append((times[start], times[peak], times[end],
+                       times[end] - times[start], flow[peak],
+                       cumvolume[end + 1] - cumvolume[start],
+                       rain[start:end + 1].max(),
+                       cumrain[end + 1] - cumrain[start]))
+        available = end + 1
+
+    events = pd.DataFrame(events, columns=['startdate', 'peakdate',
+                                           'enddate', 'duration',
+                                           'peakflow', 'volume', 'peakrain',
+                                           'totalrain'])
+    events.index.name = 'event'
+    return pd.Series(eventids, index=times, name='event'), events
+
+
+# shared memory arrays of the storms_per_station worker processes
+_SHARED_ARRAYS = {}
+
+
+def _share_array(array):
+    """ np.ndarray -> (SharedMemory, tuple)
+    Copy the array into a new shared memory block, returns the block and
+    the (name, shape, dtype) descriptor to attach to it in other processes
+    """
+    from multiprocessing import shared_memory
+
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+    shared[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def _attach_shared_arrays(descriptors):
+    """ dict -> None
+    Initializer of the worker processes: attach (read-only) to the shared
+    memory blocks
+    """
+    from multiprocessing import shared_memory
+
+    for key, (name, shape, dtype) in descriptors.items():
+        block = shared_memory.SharedMemory(name=name)
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array.flags.writeable = False
+        _SHARED_ARRAYS[key] = (block, array)
+
+
+def _station_storms(task):
+    """ tuple -> pd.DataFrame
+    Worker function: storm derivation of a single station on the shared
+    flow and rain arrays
+    """
+    flowposition, rainposition, segment, kwargs = task
+    flowserie = pd.Series(_SHARED_ARRAYS["flow"][1][flowposition],
+                          index=pd.DatetimeIndex(
+                              _SHARED_ARRAYS["flowtimes"][1]))
+    rainserie = pd.Series(_SHARED_ARRAYS["rain"][1][rainposition],
+                          index=pd.DatetimeIndex(
+                              _SHARED_ARRAYS["raintimes"][1]))
+    if segment:
+        return segmentstorms(flowserie, rainserie, **kwargs)[1]
+    return pd.DataFrame(selectstorms(flowserie, rainserie, **kwargs),
+                        columns=['startdate', 'enddate'])
+
+
+def storms_per_station(flowdata, raindata, pairs=None, segment=False,
+                       processes=None, **kwargs):
+    """ (pd.DataFrame, pd.DataFrame) -> pd.DataFrame
+    Derive the storms of many stations in parallel: the stations are
+    handled by a pool of processes, which all read the flow and rain
+    values from shared memory instead of getting a copy of the data.
+
+    Parameters
+    ----------
+    flowdata : pd.DataFrame
+        Flow timeseries with the date in the index and a column for each
+        station
+    raindata : pd.DataFrame or pd.Series
+        Rain timeseries with the date in the index. A single Series is
+        used for all stations
+    pairs : None or dict
+        rain column to use for each flow column, {flow column: rain
+        column}. When None, all flow columns are paired with the rain
+        column with the same name (or with the single rain Series)
+    segment : bool
+        when False, selectstorms is used for each station, when True
+        segmentstorms
+    processes : None or int
+        number of worker processes, by default the number of CPUs
+    **kwargs :
+        arguments passed to selectstorms or segmentstorms, e.g.
+        number_of_storms or drywindow
+
+    Returns
+    -------
+    storms : pd.DataFrame
+        the storms (start and end dates) or events of all stations, with
+        the station and the storm number in the index. The stations
+        without any storm or event are listed in storms.attrs['nostorms']
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if isinstance(raindata, pd.Series):
+        raindata = raindata.to_frame()
+        if pairs is None:
+            pairs = dict((column, raindata.columns[0])
+                         for column in flowdata.columns)
+    if pairs is None:
+        pairs = dict((column, column) for column in flowdata.columns)
+
+    stations = list(pairs.keys())
+    tasks = [(flowdata.columns.get_loc(station),
+              raindata.columns.get_loc(pairs[station]), segment, kwargs)
+             for station in stations]
+
+    blocks = []
+    descriptors = {}
+    try:
+        for key, array in [
+                ("flow", np.ascontiguousarray(flowdata.values.T,
+                                              dtype=float)),
+                ("flowtimes", flowdata.index.values),
+                ("rain", np.ascontiguousarray(raindata.values.T,
+                                              dtype=float)),
+                ("raintimes", raindata.index.values)]:
+            block, descriptors[key] = _share_array(array)
+            blocks.append(block)
+
+        with ProcessPoolExecutor(max_workers=processes,
+                                 initializer=_attach_shared_arrays,
+                                 initargs=(descriptors,)) as executor:
+            results = list(executor.map(_station_storms, tasks))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    storms = pd.concat(results, keys=stations, names=['station', 'storm'])
+    # stations without storms give no rows, they are listed in attrs
+    storms.attrs['nostorms'] = [station for station, result in
+                                zip(stations, results) if result.empty]
+    return storms
+
+
 def _control_dayhour(Timestamp):
     """pd.TimeStamp -> int
 
@@ -148,7 +452,7 @@ def _getsize(nrows):
     propose height of the figure based on number of rows
     """
     size_dict = {1: 6, 2: 6, 3: 8, 4: 8, 5: 10, 6: 12}
-    return size_dict[nrows]
+    return size_dict.get(nrows, 2*nrows)
 
 
 def _add_labels_above(ax0, fig, flowdim, raindim):
@@ -197,20 +501,15 @@ def _make_comparable(axes):
             axs = axs.set_ybound(upper=flowmax)
 
 
-def plotstorms(flowserie, rainserie, selected_storm,
-               tsfreq=None, tsfrequnit=None,
-               make_comparable=False,
-               period_title=False):
+def _draw_storms(fig, flowserie, rainserie, selected_storm,
+                 make_comparable=False, period_title=False):
     """
-    Plot Flow-Rain plots for every storm period selected,
+    Draw the Flow-Rain plots for every storm period selected in the
+    given (empty) figure, without using the global pyplot state
 
-    optimal sizes and configuration done for 1 till 5 subplots (storms)
+    Returns all axes of the figure
     """
-    if len(selected_storm) > 6:
-        raise Exception('Split plotting up in multiple figures')
-    fig = plt.figure(facecolor='white',
-                     figsize=(12, _getsize(len(selected_storm))))
-    gs0 = gridspec.GridSpec(len(selected_storm), 1)
+    gs0 = gridspec.GridSpec(len(selected_storm), 1, figure=fig)
     gs0.update(hspace=0.35)
 
     for j, storm in enumerate(selected_storm):
@@ -220,15 +519,14 @@ def plotstorms(flowserie, rainserie, selected_storm,
                                                 height_ratios=[2, 4])
         # RAIN PLOT
         ax0 = fig.add_subplot(gs00[0])
-        ax0.plot(
-            rainserie[storm['startdate']: storm['enddate']].index.to_pydatetime(),
-            rainserie[storm['startdate']: storm['enddate']].values,
-            linestyle='steps')
+        stormrain = rainserie[storm['startdate']: storm['enddate']]
+        ax0.plot(stormrain.index.values, stormrain.values,
+                 drawstyle='steps')
 
         # FLOW PLOT
         stormflow = flowserie[storm['startdate']: storm['enddate']]
         ax1 = fig.add_subplot(gs00[1], sharex=ax0)
-        ax1.plot(stormflow.index.to_pydatetime(), stormflow.values,
+        ax1.plot(stormflow.index.values, stormflow.values,
                  label=r" Measured Flow ($m^3s^{-1}$)")
         # if single plots of flow/rain -> set specific color
         if flowserie.ndim == 1:
@@ -273,11 +571,110 @@ def plotstorms(flowserie, rainserie, selected_storm,
         ax1.spines['bottom'].set_visible(False)
         ax1.set_xlabel('')
 
-    plt.draw()
     all_axes = fig.get_axes()
 
     # Give all the subplots the same y-bounds
     if make_comparable:
         _make_comparable(all_axes)
 
+    return all_axes
+
+
+def plotstorms(flowserie, rainserie, selected_storm,
+               tsfreq=None, tsfrequnit=None,
+               make_comparable=False,
+               period_title=False):
+    """
+    Plot Flow-Rain plots for every storm period selected,
+
+    optimal sizes and configuration done for 1 till 6 subplots (storms),
+    use plotstorms_batch to split a large number of storms over multiple
+    figures
+    """
+    fig = plt.figure(facecolor='white',
+                     figsize=(12, _getsize(len(selected_storm))))
+    all_axes = _draw_storms(fig, flowserie, rainserie, selected_storm,
+                            make_comparable=make_comparable,
+                            period_title=period_title)
+    plt.draw()
     return fig, all_axes
+
+
+# figure reused by the plotstorms_batch worker processes
+_PAGE_FIGURE = []
+
+
+def _render_storm_page(task):
+    """ tuple -> str
+    Worker function: draw a page of storms with the Agg backend and save
+    it, reusing the figure of the process between pages
+    """
+    flowserie, rainserie, selected_storm, filename, kwargs = task
+    if not _PAGE_FIGURE:
+        fig = Figure(facecolor='white')
+        FigureCanvasAgg(fig)
+        _PAGE_FIGURE.append(fig)
+    fig = _PAGE_FIGURE[0]
+    fig.clear()
+    fig.set_size_inches(12, _getsize(len(selected_storm)))
+    _draw_storms(fig, flowserie, rainserie, selected_storm, **kwargs)
+    fig.savefig(filename, facecolor='white')
+    return filename
+
+
+def plotstorms_batch(flowserie, rainserie, selected_storm, filename,
+                     storms_per_page=6, processes=None,
+                     make_comparable=False, period_title=True):
+    """
+    Render the Flow-Rain plots of a large number of storms to files,
+    paginated with storms_per_page storms per file. The pages are drawn
+    with the Agg backend (no display or pyplot state needed) by a pool of
+    processes.
+
+    Parameters
+    ----------
+    flowserie : pd.Series or pd.DataFrame
+        Flow timeserie(s) with the date in the index
+    rainserie : pd.Series or pd.DataFrame
+        Rain timeserie(s) with the date in the index
+    selected_storm : list of dict
+        storms with startdate and enddate, e.g. output of selectstorms
+    filename : str
+        file name pattern with a page number field, the extension defines
+        the file format, e.g. "storms_{:03d}.png" or "report_{}.pdf"
+    storms_per_page : int
+        number of storms on a single page
+    processes : None or int
+        number of worker processes, by default the number of CPUs
+
+    Returns
+    -------
+    filenames : list of str
+        names of the written files
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if filename.format(1) == filename.format(2):
+        raise Exception('filename should contain a page number field, '
+                        'e.g. "storms_{:03d}.png"')
+
+    kwargs = {'make_comparable': make_comparable,
+              'period_title': period_title}
+    tasks = []
+    for page, first in enumerate(range(0, len(selected_storm),
+                                       storms_per_page)):
+        storms = selected_storm[first:first + storms_per_page]
+        # only send the data of the storm periods to the workers
+        flowparts = pd.concat([flowserie[storm['startdate']:
+                                         storm['enddate']]
+                               for storm in storms])
+        rainparts = pd.concat([rainserie[storm['startdate']:
+                                         storm['enddate']]
+                               for storm in storms])
+        flowparts = flowparts[~flowparts.index.duplicated()].sort_index()
+        rainparts = rainparts[~rainparts.index.duplicated()].sort_index()
+        tasks.append((flowparts, rainparts, storms,
+                      filename.format(page + 1), kwargs))
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(_render_storm_page, tasks))
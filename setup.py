@@ -19,6 +19,7 @@ setup(name='hydropy',
       include_package_data=True,
       install_requires=['scipy', 'numpy', 'pandas', 'matplotlib', 'seaborn',
                         'requests', 'IPython'],
+      extras_require={'store': ['pyarrow']},
       tests_require=['mock'],
       packages=['hydropy'],
       keywords='hydrology time series hydroTSM',
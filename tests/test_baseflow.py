@@ -5,6 +5,7 @@ test_baseflow.py
 """
 
 from __future__ import absolute_import, print_function
+import json
 import unittest
 
 import numpy as np
@@ -29,3 +30,56 @@ class TestBaseflow(unittest.TestCase):
     def test_baseflow_get_bf_ihacres_returns_dataframe(self):
         actual = hp.get_baseflow_ihacres(discharge, 0.5, 0.5, 0.0001)
         self.assertIs(type(actual), pd.DataFrame)
+
+    def test_baseflow_ihacres_equals_recursive_definition(self):
+        flow = discharge['Qtest'].abs()
+        recession_time, parC, alfa = 0.9, 0.3, -0.2
+        expected = np.zeros(len(flow))
+        for i in range(1, len(flow)):
+            expected[i] = recession_time*expected[i-1]/(1 + parC) + \
+                parC/(1 + parC)*(flow.values[i] + alfa*flow.values[i-1])
+        actual = hp.get_baseflow_ihacres(flow, recession_time, parC, alfa)
+        np.testing.assert_allclose(actual.values[:, 0], expected)
+
+    def test_baseflow_handles_empty_flowserie(self):
+        empty = discharge.iloc[:0]
+        for actual in [hp.get_baseflow_chapman(empty, 0.9),
+                       hp.get_baseflow_boughton(empty, 0.9, 0.3),
+                       hp.get_baseflow_ihacres(empty, 0.9, 0.3, -0.2)]:
+            self.assertEqual(actual.shape, (0, 1))
+            self.assertEqual(list(actual.columns), ['Qtest'])
+
+    def test_baseflow_keeps_column_names_of_all_stations(self):
+        flows = pd.DataFrame(np.random.rand(len(time), 3), index=time,
+                             columns=['Q1', 'Q2', 'Q3'])
+        actual = hp.get_baseflow_boughton(flows, 0.9, 0.3)
+        self.assertEqual(list(actual.columns), ['Q1', 'Q2', 'Q3'])
+        single = hp.get_baseflow_boughton(flows['Q2'], 0.9, 0.3)
+        np.testing.assert_allclose(actual['Q2'].values, single['Q2'].values)
+
+    def test_baseflow_sweep_equals_single_parameter_runs(self):
+        flow = discharge.abs()
+        actual = hp.get_baseflow_sweep(flow, "boughton", [0.5, 0.9],
+                                       [0.1, 0.3, 0.6], summary=None,
+                                       chunksize=30)
+        self.assertEqual(actual.shape, (6, len(time), 1))
+        expected = hp.get_baseflow_boughton(flow, 0.9, 0.6)
+        np.testing.assert_allclose(actual[5], expected.values)
+
+        bfi = hp.get_baseflow_sweep(flow, "boughton", [0.5, 0.9],
+                                    [0.1, 0.3, 0.6], chunksize=30)
+        self.assertAlmostEqual(bfi.loc[(0.9, 0.6), 'Qtest'],
+                               expected['Qtest'].sum() / flow['Qtest'].sum())
+
+    def test_baseflow_filter_updates_equal_full_record(self):
+        flow = discharge.abs()
+        bffilter = hp.IhacresFilter(0.9, 0.3, -0.1)
+        first = bffilter.update(flow.iloc[:40])
+        state = json.loads(json.dumps(bffilter.get_state()))
+        restored = hp.BaseflowFilter.from_state(state)
+        # overlapping values are ignored
+        second = restored.update(flow.iloc[30:])
+        actual = pd.concat([first, second])
+        expected = hp.get_baseflow_ihacres(flow, 0.9, 0.3, -0.1)
+        np.testing.assert_allclose(actual.values, expected.values)
+        self.assertEqual(restored.last_date, time[-1])
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+test_binary.py
+"""
+
+from __future__ import absolute_import, print_function
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from hydropy import binary
+from hydropy.flowanalysis import HydroAnalysis
+
+
+class TestBinary(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.filename = tempfile.mkstemp(suffix='.hyb')
+        os.close(handle)
+        time = pd.date_range('2009-01-01', '2010-12-31 18:00', freq='6h')
+        self.flows = pd.DataFrame(np.random.rand(len(time), 2), index=time,
+                                  columns=['Q1', 'Q2'])
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_binary_roundtrip(self):
+        binary.write_binary(self.flows, self.filename)
+        actual = binary.open_binary(self.filename)
+        assert_frame_equal(actual, self.flows, check_index_type=False,
+                           check_names=False)
+        self.assertEqual(actual.index.freq, self.flows.index.freq)
+        binary.write_binary(self.flows, self.filename, dtype='float32')
+        actual = binary.open_binary(self.filename)
+        self.assertEqual(actual['Q2'].dtype, np.float32)
+        np.testing.assert_allclose(actual.values, self.flows.values,
+                                   rtol=1e-6)
+
+    def test_binary_requires_fixed_time_step(self):
+        with self.assertRaises(Exception):
+            binary.write_binary(self.flows.iloc[[0, 1, 3]], self.filename)
+
+    def test_binary_hydroanalysis_selection_uses_memory_map(self):
+        HydroAnalysis(self.flows).to_binary(self.filename)
+        hydro = HydroAnalysis.from_binary(self.filename)
+        selection = hydro.get_date_range('2010-03-01', '2010-04-01')
+        values = selection.data['Q1'].values
+        while not isinstance(values, np.memmap) and values.base is not None:
+            values = values.base
+        self.assertIsInstance(values, np.memmap)
+        self.assertEqual(selection.data['Q1'].tolist(),
+                         self.flows.loc['2010-03-01':'2010-04-01',
+                                        'Q1'].tolist())
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+test_events.py
+"""
+
+from __future__ import absolute_import, print_function
+import unittest
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+import hydropy as hp
+
+time = pd.date_range('1/1/2010', periods=500, freq='h')
+flows = pd.DataFrame(np.random.rand(len(time), 3), index=time,
+                     columns=['Q1', 'Q2', 'Q3'])
+
+
+class TestEventTable(unittest.TestCase):
+
+    def test_events_percentile_table_expands_to_dense_selection(self):
+        hydro = hp.HydroAnalysis(flows)
+        events = hydro.get_above_percentile(0.9, as_table=True)
+        self.assertEqual(events.table['station'].dtype, np.int32)
+        self.assertEqual(len(events), 3 * 50)
+        expected = hydro.get_above_percentile(0.9).data[['Q1', 'Q2', 'Q3']]
+        assert_frame_equal(events.to_dense(), expected, check_freq=False)
+
+    def test_events_table_is_sorted_on_time_and_station(self):
+        events = hp.HydroAnalysis(flows).get_lowpeaks(3, as_table=True)
+        table = events.table
+        order = table.sort_values(['datetime', 'station']).index
+        self.assertTrue((order == table.index).all())
+        self.assertEqual(set(events.to_frame()['station']),
+                         set(['Q1', 'Q2', 'Q3']))
@@ -6,6 +6,10 @@ test_flowanalysis.py
 from __future__ import absolute_import, print_function
 import unittest
 
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
 from hydropy import flowanalysis as fa
 
 
@@ -17,6 +21,173 @@ class TestHydroAnalysis(unittest.TestCase):
         with self.assertRaises(Exception):
             actual = fa.HydroAnalysis(nonsense)
 
+    def test_HydroAnalysis_get_baseflow_handles_all_columns(self):
+        time = pd.date_range('1/1/2010', periods=100, freq='D')
+        flows = pd.DataFrame(np.random.rand(len(time), 2), index=time,
+                             columns=['Q1', 'Q2'])
+        actual = fa.HydroAnalysis(flows).get_baseflow("ihacres",
+                                                      recession_time=0.9,
+                                                      baseflow_index=0.3,
+                                                      alfa=-0.1)
+        self.assertEqual(list(actual._data_cols), ['Q1', 'Q2'])
+        self.assertEqual(actual.data.shape[0], 100)
+
+    def test_HydroAnalysis_labels_seasons_on_start_dates(self):
+        time = pd.date_range('2009-01-01', '2010-12-31 18:00', freq='6h')
+        flows = pd.DataFrame(np.random.rand(len(time)), index=time)
+        seasons = fa.HydroAnalysis(flows).data["season"]
+        self.assertEqual(seasons['2009-05-31 18:00'], "Spring")
+        self.assertEqual(seasons['2009-06-01 00:00'], "Summer")
+        self.assertEqual(seasons['2009-02-15 12:00'], "Winter")
+        self.assertEqual(seasons['2010-12-31 18:00'], "Winter")
+        seasons = fa.HydroAnalysis(flows, season_type="astro").data["season"]
+        self.assertEqual(seasons['2009-09-20 18:00'], "Summer")
+        self.assertEqual(seasons['2009-09-21 00:00'], "Autumn")
+
+    def test_HydroAnalysis_selections_share_data_until_copy(self):
+        time = pd.date_range('2009-01-01', '2010-12-31 18:00', freq='6h')
+        flows = pd.DataFrame(np.random.rand(len(time), 2), index=time,
+                             columns=['Q1', 'Q2'])
+        parent = fa.HydroAnalysis(flows)
+        selection = parent.get_year('2009').get_date_range('2009-03-01',
+                                                          '2009-04-01')
+        self.assertTrue(np.shares_memory(selection.data['Q1'].values,
+                                         parent.data['Q1'].values))
+        self.assertEqual(selection.data.index.freq, parent.data.index.freq)
+        self.assertFalse(np.shares_memory(selection.copy().data['Q1'].values,
+                                          parent.data['Q1'].values))
+
+    def test_HydroAnalysis_get_season_keeps_frequency(self):
+        time = pd.date_range('2009-01-01', '2010-12-31 18:00', freq='6h')
+        flows = pd.DataFrame(np.random.rand(len(time)), index=time,
+                             columns=['Q1'])
+        summer = fa.HydroAnalysis(flows).get_season('summer')
+        self.assertEqual(summer.data.index[0], pd.Timestamp('2009-06-01'))
+        self.assertEqual(summer.data.index[-1],
+                         pd.Timestamp('2010-08-31 18:00'))
+        self.assertEqual(summer.data.index.freq, flows.index.freq)
+        self.assertEqual(summer.data['Q1'].count(), 2 * 92 * 4)
+        self.assertTrue((summer.data['season'] != "Summer").any())
+
+    def test_HydroAnalysis_lazy_selection_equals_chained_selection(self):
+        time = pd.date_range('2009-01-01', '2011-12-31 18:00', freq='6h')
+        flows = pd.DataFrame(np.random.rand(len(time), 2), index=time,
+                             columns=['Q1', 'Q2'])
+        flows.iloc[400:500, 0] = np.nan
+        hydro = fa.HydroAnalysis(flows)
+        expected = hydro.get_year('2010').get_season('summer')\
+            .get_above_percentile(0.3).get_climbing().get_month('Jul')
+        actual = hydro.lazy().get_year('2010').get_season('summer')\
+            .get_above_percentile(0.3).get_climbing().get_month('Jul')
+        assert_frame_equal(actual.collect().data, expected.data)
+
+    def test_HydroAnalysis_get_highpeaks_selects_first_of_plateau(self):
+        time = pd.date_range('2009-01-01', periods=12, freq='h')
+        flows = pd.DataFrame({'Q1': [1., 2., 5., 5., 5., 2., 1., 0., 3., 1.,
+                                     0., 0.],
+                              'Q2': [0., 1., 2., 3., 2., 1., 0., 1., 4., 1.,
+                                     0., 0.]}, index=time)
+        hydro = fa.HydroAnalysis(flows)
+        peaks = hydro.get_highpeaks(2, as_table=True).to_frame()
+        self.assertEqual(peaks['datetime'].tolist(),
+                         [time[2], time[3], time[8], time[8]])
+        self.assertEqual(peaks['station'].tolist(), ['Q1', 'Q2', 'Q1', 'Q2'])
+        self.assertEqual(peaks['value'].tolist(), [5., 3., 3., 4.])
+        dense = hydro.get_highpeaks(2).data
+        self.assertEqual(dense['Q1'].count(), 2)
+        self.assertEqual(dense['Q1'].iloc[2], 5.)
+
+    def test_HydroAnalysis_regular_selections_equal_label_selections(self):
+        time = pd.date_range('2009-01-01 03:00', '2011-12-31 18:00',
+                             freq='3h')
+        flows = pd.DataFrame(np.random.rand(len(time), 2), index=time,
+                             columns=['Q1', 'Q2'])
+        regular = fa.HydroAnalysis(flows, season_type="astro")
+        labels = fa.HydroAnalysis(flows, season_type="astro")
+        labels._regular = None
+        self.assertEqual(regular._regular[1:], (3 * 3600 * 10**9, len(time)))
+        for select in [lambda hydro: hydro.get_year('2010'),
+                       lambda hydro: hydro.get_date_range('2009-03-01',
+                                                          '2010-06'),
+                       lambda hydro: hydro['2010-02-03 04:00':'2011'],
+                       lambda hydro: hydro.get_month('Dec'),
+                       lambda hydro: hydro.get_season('winter')]:
+            assert_frame_equal(select(regular).data, select(labels).data)
+
+    def test_HydroAnalysis_compact_mode_keeps_selections(self):
+        time = pd.date_range('2009-01-01', '2010-12-31 18:00', freq='6h')
+        flows = pd.DataFrame(np.random.rand(len(time), 2), index=time,
+                             columns=['Q1', 'Q2'])
+        default = fa.HydroAnalysis(flows)
+        compact = fa.HydroAnalysis(flows, compact=True)
+        self.assertEqual(list(compact.data.columns), ['Q1', 'Q2'])
+        self.assertTrue((compact.data.dtypes == np.float32).all())
+        for select in [lambda hydro: hydro.get_season('summer'),
+                       lambda hydro: hydro.get_month('Mar')['Q2'],
+                       lambda hydro: hydro.get_year('2010')
+                       .get_above_percentile(0.5),
+                       lambda hydro: hydro.lazy().get_season('winter')
+                       .get_climbing().collect()]:
+            expected = select(default)
+            actual = select(compact)
+            np.testing.assert_allclose(
+                actual.data[expected._data_cols].values,
+                expected.data[expected._data_cols].values, rtol=1e-6)
+        self.assertEqual(compact.get_season('autumn')._season_labels()
+                         .iloc[0], "Autumn")
+
+        # selections share the season labels of the parent
+        labels = compact._season_labels()
+        view = compact.get_year('2010')['Q1']
+        self.assertIsNotNone(view._season)
+        self.assertTrue(view._season_labels().equals(labels['2010']))
+
+    def test_HydroAnalysis_quantile_equals_pandas_and_resets_cache(self):
+        time = pd.date_range('2010-01-01', periods=1000, freq='h')
+        flows = pd.DataFrame(np.random.rand(len(time), 2), index=time,
+                             columns=['Q1', 'Q2'])
+        flows.iloc[::7, 1] = np.nan
+        hydro = fa.HydroAnalysis(flows)
+        pd.testing.assert_series_equal(hydro.quantile(0.37),
+                                       flows.quantile(0.37))
+        assert_frame_equal(hydro.quantile([0.1, 0.9, 0.5]),
+                           flows.quantile([0.1, 0.9, 0.5]))
+        self.assertEqual(sorted(hydro._sorted), ['Q1', 'Q2'])
+        hydro.data = hydro.data.assign(Q1=2.*flows['Q1'])
+        self.assertEqual(hydro._sorted, {})
+        self.assertAlmostEqual(hydro.quantile(1.)['Q1'],
+                               2.*flows['Q1'].max())
+
+        # in-place edits of data need an explicit invalidation
+        hydro.data['Q1'] = hydro.data['Q1']*10.
+        hydro.invalidate_quantiles()
+        pd.testing.assert_series_equal(
+            hydro.quantile(0.5), hydro.data[['Q1', 'Q2']].quantile(0.5))
+        hydro.data.iloc[3, 1] = 100.
+        self.assertNotEqual(hydro.quantile(1.)['Q2'], 100.)
+        hydro.invalidate_quantiles()
+        self.assertEqual(hydro.quantile(1.)['Q2'], 100.)
+
+    def test_HydroAnalysis_decimation_keeps_extremes(self):
+        values = np.random.rand(1000, 2)
+        values[537, 0] = 5.
+        values[101, 1] = -5.
+        values[300:400, 1] = np.nan
+        rows = fa.HydroAnalysis._decimate_rows(values, 50)
+        self.assertTrue(len(rows) <= 2 * 2 * 50 + 2)
+        self.assertEqual(rows[0], 0)
+        self.assertEqual(rows[-1], 999)
+        self.assertIn(537, rows)
+        self.assertIn(101, rows)
+        for col in range(2):
+            for bucket in range(50):
+                window = values[bucket*20:(bucket + 1)*20, col]
+                selected = values[rows[(rows >= bucket*20) &
+                                       (rows < (bucket + 1)*20)], col]
+                if not np.isnan(window).all():
+                    self.assertEqual(np.nanmax(selected), np.nanmax(window))
+                    self.assertEqual(np.nanmin(selected), np.nanmin(window))
+
 """
 from pandas.util.testing import assert_frame_equal
 
@@ -35,4 +206,4 @@ class TestGetFunctions():
 
         ms3 = temp.get_month("Jun").get_recess().data # abbr
         assert_frame_equal(ms1, ms3)
-"""
\ No newline at end of file
+"""
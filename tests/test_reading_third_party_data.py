@@ -4,16 +4,22 @@ test_reading_third_party_data.py
 """
 
 from __future__ import absolute_import, print_function
+import os
+import shutil
+import tempfile
 import unittest
 
 try:
     from unittest import mock
 except ImportError:
     import mock
+import numpy as np
 import pandas as pd
+from pandas.testing import assert_frame_equal
 
 from hydropy import reading_third_party_data as r3p
 from hydropy import exceptions
+from hydropy.store import read_store, pq
 
 good_json = {'declaredType': 'org.cuahsi.waterml.TimeSeriesResponseType',
  'globalScope': True,
@@ -98,10 +104,170 @@ good_json = {'declaredType': 'org.cuahsi.waterml.TimeSeriesResponseType',
      'variableName': 'Streamflow, ft&#179;/s',
      'variableProperty': []}}]}}
 
+zrx_text = """#REXCHANGE12345|*|SANR12345|*|SNAMEGent Sluis|*|
+#CNAMEQ|*|CUNITm3/s|*|RINVAL-777.0|*|TZUTC+1|*|
+#LAYOUT(timestamp,value)|*|
+20100101000000 1.5
+20100101001500 -777.0
+20100101003000 2.25
+"""
+
+
+class FakeFTP(object):
+    """stand-in for ftplib.FTP serving the files of a dict"""
+    files = {}
+    opened = []
+
+    def __init__(self, server):
+        self.opened.append(self)
+        self.logged_in = False
+
+    def login(self, login, password):
+        self.logged_in = (login, password) == ('user', 'secret')
+
+    def cwd(self, path):
+        pass
+
+    def nlst(self):
+        return list(self.files)
+
+    def retrbinary(self, command, callback, rest=None):
+        content = self.files[command[len("RETR "):]][int(rest or 0):]
+        for start in range(0, len(content), 8):
+            callback(content[start:start + 8])
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
 class TestReadVMM(unittest.TestCase):
 
+    def setUp(self):
+        handle, self.zrxfile = tempfile.mkstemp(suffix='.zrx')
+        with os.fdopen(handle, 'w') as zrxf:
+            zrxf.write(zrx_text)
+
+    def tearDown(self):
+        os.remove(self.zrxfile)
+
     def test_r3p_load_VMM_zrx_timeserie_returns_df(self):
-        pass
+        data = r3p.load_VMM_zrx_timeserie(self.zrxfile)
+        name = os.path.basename(self.zrxfile)[:-4]
+        self.assertEqual(list(data.columns), [name])
+        self.assertEqual(list(data.index),
+                         list(pd.date_range('2010-01-01', periods=3,
+                                            freq='15min')))
+        self.assertEqual(data[name].iloc[0], 1.5)
+        self.assertTrue(pd.isnull(data[name].iloc[1]))
+        self.assertEqual(data.attrs['SNAME'], 'Gent Sluis')
+        self.assertEqual(data.attrs['CUNIT'], 'm3/s')
+
+    def test_r3p_load_VMM_zrx_timeserie_in_chunks(self):
+        chunks = list(r3p.load_VMM_zrx_timeserie(self.zrxfile, chunksize=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+        assert_frame_equal(pd.concat(chunks),
+                           r3p.load_VMM_zrx_timeserie(self.zrxfile))
+        self.assertEqual(r3p.read_VMM_zrx_header(self.zrxfile)['TZ'],
+                         'UTC+1')
+
+    def test_r3p_load_VMM_zrx_timeseries_aligns_directory(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            for name, start, periods in [('P1', '2010-01-01', 4),
+                                         ('P2', '2010-01-01 00:30', 3),
+                                         ('P3', '2009-12-31 23:45', 2)]:
+                time = pd.date_range(start, periods=periods, freq='15min')
+                with open(os.path.join(tempdir, name + '.zrx'), 'w') as zrxf:
+                    zrxf.write("#SANR{}|*|RINVAL-777.0|*|\n".format(name))
+                    for i, stamp in enumerate(time):
+                        zrxf.write("{:%Y%m%d%H%M%S} {}\n".format(stamp, i))
+            with open(os.path.join(tempdir, 'readme.txt'), 'w') as other:
+                other.write("not a zrx file")
+            data = r3p.load_VMM_zrx_timeseries(tempdir, processes=2)
+            expected = pd.concat(
+                [r3p.load_VMM_zrx_timeserie(os.path.join(tempdir,
+                                                         name + '.zrx'))
+                 for name in ['P1', 'P2', 'P3']], axis=1, sort=True)
+            assert_frame_equal(data, expected, check_freq=False)
+            self.assertEqual(data.attrs['P2']['SANR'], 'P2')
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_r3p_ftp_source_reuses_connections(self):
+        FakeFTP.files = dict(('S{}.zrx'.format(i), zrx_text.encode())
+                             for i in range(20))
+        FakeFTP.files['readme.txt'] = b'not a zrx file'
+        FakeFTP.opened = []
+        source = r3p.FtpZrxSource('ftp.test', 'user', 'secret', 'data',
+                                  connections=3, ftp_factory=FakeFTP)
+        data = r3p.load_VMM_zrx_timeseries(source, processes=2)
+        source.close()
+        self.assertEqual(list(data.columns),
+                         sorted('S{}'.format(i) for i in range(20)))
+        self.assertEqual(data['S7'].iloc[2], 2.25)
+        self.assertTrue(1 <= len(FakeFTP.opened) <= 3)
+        self.assertTrue(all(ftp.logged_in for ftp in FakeFTP.opened))
+
+    @unittest.skipIf(pq is None, "pyarrow not installed")
+    def test_r3p_sync_appends_only_new_rows(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            source = os.path.join(tempdir, 'source')
+            store = os.path.join(tempdir, 'store')
+            os.makedirs(source)
+            zrxfile = os.path.join(source, 'P1.zrx')
+            shutil.copy(self.zrxfile, zrxfile)
+            self.assertEqual(r3p.sync_VMM_zrx_timeseries(source, store),
+                             {'P1': 3})
+            self.assertEqual(r3p.sync_VMM_zrx_timeseries(source, store), {})
+            with open(zrxfile, 'a') as zrxf:
+                zrxf.write("20100101004500 3.5\n2010010101")
+            self.assertEqual(r3p.sync_VMM_zrx_timeseries(source, store),
+                             {'P1': 1})
+            with open(zrxfile, 'a') as zrxf:
+                zrxf.write("0000 4.5\n")
+            self.assertEqual(r3p.sync_VMM_zrx_timeseries(source, store),
+                             {'P1': 1})
+            stored = read_store(store)
+            self.assertEqual(list(stored.index),
+                             list(pd.date_range('2010-01-01', periods=5,
+                                                freq='15min')))
+            self.assertEqual(stored['P1'].iloc[-1], 4.5)
+        finally:
+            shutil.rmtree(tempdir)
+
+
+class TestReadCEH(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.cehfile = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w') as cehf:
+            cehf.write("station, year, month, day, minute, flow, level\n"
+                       "39001, 1999, 12, 31, 1425, 1.5, 0.2\n"
+                       "39001, 2000, 2, 29, 0, 2.5, 0.3\n"
+                       "39001, 2000, 3, 1, 75, 3.5, 0.4\n")
+
+    def tearDown(self):
+        os.remove(self.cehfile)
+
+    def test_r3p_load_CEH_timeserie_builds_datetime_index(self):
+        data = r3p.load_CEH_timeserie(self.cehfile)
+        self.assertEqual(data.index.name, 'Datetime')
+        self.assertEqual(list(data.index),
+                         [pd.Timestamp('1999-12-31 23:45'),
+                          pd.Timestamp('2000-02-29 00:00'),
+                          pd.Timestamp('2000-03-01 01:15')])
+        self.assertEqual(list(data.columns), ['station', 'flow', 'level'])
+        self.assertEqual(data['flow'].tolist(), [1.5, 2.5, 3.5])
+
+    def test_r3p_load_CEH_timeserie_selects_columns_and_dtype(self):
+        data = r3p.load_CEH_timeserie(self.cehfile, dtype={'flow': 'float32'},
+                                      usecols=['flow'])
+        self.assertEqual(list(data.columns), ['flow'])
+        self.assertEqual(data['flow'].dtype, np.float32)
 
 
 class TestGetUSGS(unittest.TestCase):
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+test_store.py
+"""
+
+from __future__ import absolute_import, print_function
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from hydropy import store
+from hydropy.flowanalysis import HydroAnalysis
+
+
+@unittest.skipIf(store.pq is None, "pyarrow not installed")
+class TestStore(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        time = pd.date_range('2009-06-01', '2011-06-30 18:00', freq='6h')
+        self.flows = pd.DataFrame(np.random.rand(len(time), 3), index=time,
+                                  columns=['Q1', 'Q2', 'Q3'])
+        self.flows.iloc[10:20, 1] = np.nan
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_store_writes_partitions_per_station_and_year(self):
+        store.write_store(self.flows, self.path)
+        self.assertEqual(store.store_stations(self.path), ['Q1', 'Q2', 'Q3'])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.path,
+                                                        'station=Q2'))),
+                         ['year=2009', 'year=2010', 'year=2011'])
+        actual = store.read_store(self.path)
+        assert_frame_equal(actual, self.flows, check_freq=False,
+                           check_index_type=False, check_names=False)
+
+    def test_store_reads_selection_and_appends(self):
+        store.write_store(self.flows.loc[:'2010-12-31'], self.path)
+        store.write_store(self.flows.loc['2010-12-01':], self.path)
+        actual = store.read_store(self.path, ['Q3', 'Q1'],
+                                  '2010-03-01', '2011-01-15')
+        expected = self.flows.loc['2010-03-01':'2011-01-15', ['Q3', 'Q1']]
+        assert_frame_equal(actual, expected, check_freq=False,
+                           check_index_type=False, check_names=False)
+
+    def test_store_roundtrip_of_hydroanalysis(self):
+        HydroAnalysis(self.flows).to_store(self.path)
+        hydro = HydroAnalysis.from_store(self.path, stations='Q2',
+                                         start='2010-01-01', end='2010-12-31')
+        self.assertEqual(list(hydro._data_cols), ['Q2'])
+        self.assertEqual(hydro.data.index[0], pd.Timestamp('2010-01-01'))
+        self.assertEqual(hydro.data.index[-1],
+                         pd.Timestamp('2010-12-31 18:00'))
+        self.assertEqual(hydro.data.index.freq, self.flows.index.freq)
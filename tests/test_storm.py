@@ -4,12 +4,136 @@ test_storm.py
 """
 
 from __future__ import absolute_import, print_function
+import os
+import shutil
+import tempfile
 import unittest
 
+import numpy as np
+import pandas as pd
+
 from hydropy import storm
 
 
 class TestStorm(unittest.TestCase):
 
     def test_storm_selectstorm(self):
-        pass
+        time = pd.date_range('1/1/2010', periods=30*24, freq='h')
+        rain = pd.Series(0., index=time)
+        rain['2010-01-15 00:00':'2010-01-15 05:00'] = 2.
+        flow = pd.Series(1., index=time)
+        flow['2010-01-15 01:00':'2010-01-15 12:00'] = np.linspace(2., 8., 12)
+        flow['2010-01-15 13:00':'2010-01-17 12:00'] = np.linspace(7., 1., 48)
+        flow['2010-01-17 13:00':] = 0.9
+        storms = storm.selectstorms(flow, rain, number_of_storms=1,
+                                    drywindow=24)
+        expected = {'startdate': pd.Timestamp('2010-01-13 23:00'),
+                    'enddate': pd.Timestamp('2010-01-17 13:00')}
+        self.assertEqual(storms, [expected])
+
+    def test_storm_segmentstorms(self):
+        time = pd.date_range('1/1/2010', periods=30*24, freq='h')
+        rain = pd.Series(0., index=time)
+        rain['2010-01-15 00:00':'2010-01-15 05:00'] = 2.
+        rain['2010-01-16 00:00'] = 1.
+        flow = pd.Series(1., index=time)
+        flow['2010-01-15 01:00':'2010-01-15 12:00'] = np.linspace(2., 8., 12)
+        flow['2010-01-15 13:00':'2010-01-17 12:00'] = np.linspace(7., 1., 48)
+        flow['2010-01-17 13:00':] = 0.9
+        eventids, events = storm.segmentstorms(flow, rain, drywindow=24)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events.loc[0, 'startdate'],
+                         pd.Timestamp('2010-01-15 00:00'))
+        self.assertEqual(events.loc[0, 'peakdate'],
+                         pd.Timestamp('2010-01-15 12:00'))
+        self.assertEqual(events.loc[0, 'enddate'],
+                         pd.Timestamp('2010-01-17 13:00'))
+        self.assertEqual(events.loc[0, 'totalrain'], 13.)
+        self.assertEqual((eventids == 0).sum(), 2*24 + 14)
+        self.assertEqual((eventids == -1).sum(), len(time) - 2*24 - 14)
+
+    def test_storm_segmentstorms_flow_peaks_with_the_rain(self):
+        time = pd.date_range('1/1/2010', periods=60, freq='D')
+        rain = pd.Series(0., index=time)
+        rain['2010-01-20'] = 5.
+        rain['2010-02-10'] = 5.
+        flow = pd.Series(1., index=time)
+        flow['2010-01-20':'2010-01-22'] = [8., 4., 2.]
+        flow['2010-01-23':'2010-02-09'] = 0.9
+        flow['2010-02-10':] = 3.
+        flow['2010-02-11'] = 9.
+        flow['2010-02-13':] = 0.8
+        eventids, events = storm.segmentstorms(flow, rain, drywindow=5)
+        self.assertEqual(list(events['startdate']),
+                         [pd.Timestamp('2010-01-20'),
+                          pd.Timestamp('2010-02-10')])
+        self.assertEqual(events.loc[0, 'peakdate'],
+                         pd.Timestamp('2010-01-20'))
+        self.assertEqual(events.loc[0, 'enddate'],
+                         pd.Timestamp('2010-01-23'))
+        self.assertEqual(events.loc[1, 'enddate'],
+                         pd.Timestamp('2010-02-13'))
+
+    def test_storm_storms_per_station_equals_single_station(self):
+        time = pd.date_range('1/1/2010', periods=60*24, freq='h')
+        random = np.random.RandomState(42)
+        rain = pd.DataFrame(np.where(random.rand(len(time), 2) < 0.01,
+                                     5., 0.),
+                            index=time, columns=['R1', 'R2'])
+        flow = pd.DataFrame(1. + rain.rolling(12, min_periods=1).sum().values,
+                            index=time, columns=['Q1', 'Q2'])
+        storms = storm.storms_per_station(flow, rain,
+                                          pairs={'Q1': 'R1', 'Q2': 'R2'},
+                                          segment=True, processes=2,
+                                          drywindow=12)
+        eventids, expected = storm.segmentstorms(flow['Q2'], rain['R2'],
+                                                 drywindow=12)
+        self.assertEqual(storms.loc['Q2'].to_dict('records'),
+                         expected.to_dict('records'))
+        self.assertEqual(storms.attrs['nostorms'], [])
+
+        flow['Q3'] = 1.
+        rain['R3'] = 0.
+        storms = storm.storms_per_station(flow, rain, segment=True,
+                                          pairs={'Q2': 'R2', 'Q3': 'R3'},
+                                          processes=2, drywindow=12)
+        self.assertEqual(storms.attrs['nostorms'], ['Q3'])
+        self.assertEqual(list(storms.index.unique('station')), ['Q2'])
+
+    def test_storm_peaks_are_separated_by_min_period(self):
+        time = pd.date_range('1/1/2010', periods=60*24, freq='h')
+        flow = pd.Series(np.random.rand(len(time)), index=time)
+        flow['2010-01-10 05:00'] = 10.
+        flow['2010-01-11 05:00'] = 9.
+        flow['2010-02-01 00:00'] = 8.
+        flow[flow.index[-1]] = np.nan
+        peaks = storm._storm_peaks(flow, 3, 7)
+        self.assertEqual(list(time[peaks[:2]]),
+                         [pd.Timestamp('2010-01-10 05:00'),
+                          pd.Timestamp('2010-02-01 00:00')])
+        self.assertTrue(abs(time[peaks[2]] - time[peaks[0]]) >=
+                        pd.Timedelta(days=7))
+        self.assertTrue(abs(time[peaks[2]] - time[peaks[1]]) >=
+                        pd.Timedelta(days=7))
+        with self.assertRaises(Exception):
+            storm._storm_peaks(flow, 10, 7)
+
+    def test_storm_plotstorms_batch_writes_pages(self):
+        time = pd.date_range('1/1/2010', periods=60*24, freq='h')
+        flow = pd.Series(np.random.rand(len(time)), index=time)
+        rain = pd.Series(np.random.rand(len(time)), index=time)
+        storms = [{'startdate': time[24*i], 'enddate': time[24*i + 30]}
+                  for i in range(0, 56, 7)]
+        tempdir = tempfile.mkdtemp()
+        try:
+            files = storm.plotstorms_batch(
+                flow, rain, storms, os.path.join(tempdir, 'storm_{}.png'),
+                storms_per_page=3, processes=2)
+            self.assertEqual([os.path.basename(name) for name in files],
+                             ['storm_1.png', 'storm_2.png', 'storm_3.png'])
+            self.assertTrue(all(os.path.getsize(name) > 0 for name in files))
+            with self.assertRaises(Exception):
+                storm.plotstorms_batch(flow, rain, storms,
+                                       os.path.join(tempdir, 'storms.png'))
+        finally:
+            shutil.rmtree(tempdir)